@@ -1,83 +1,223 @@
 from dotenv import load_dotenv
-from groq import Groq
+import asyncio
+import logging
 import os
-import uuid
+import re
+import textwrap
+import yaml
+from telemetry import LLM_REQUEST_SECONDS
 
 
 load_dotenv()
 
-api_key = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=api_key)
+# Providers read their settings from the environment, so load .env first
+from .providers import llm_provider
 
+AI_HELP_CONCURRENCY = int(os.getenv("AI_HELP_CONCURRENCY", "8"))
+AI_HELP_TIMEOUT = float(os.getenv("AI_HELP_TIMEOUT", "10"))
+AI_HELP_FALLBACK = "Not quite. Take another look at the question and try again."
 
-def get_ai_help(answerCorrect: str, answerIncorrect: str, question: str) -> str:
+ai_help_semaphore = asyncio.Semaphore(AI_HELP_CONCURRENCY)
+# In-flight hint requests, keyed by prompt contents so identical misses share one LLM call
+ai_help_requests = {}
 
-    chat_completion = client.chat.completions.create(
-        messages=[
-            #{
-            #    "role": "system",
-            #    "content": "Provide hints and explanations without giving the answer. Be brief."
-            #},
-            {
-                "role": "user",
-                "content": f"Provide hints and help the user understand. Do not give the answer. Be brief. Don't give affirmations. Question: {question}\nCorrect Answer: {answerCorrect}\nUser's Answer: {answerIncorrect}"
-            }
-        ],
-        model="llama3-8b-8192",
-        max_tokens=100,
-        stream=False
-    )
 
+async def get_ai_help(answerCorrect: str, answerIncorrect: str, question: str) -> str:
+    """
+    Get a hint for a wrong answer without blocking the event loop.
 
-
-    return chat_completion.choices[0].message.content
-
-def generate_questions(prompt: str) -> str:
+    Concurrent calls for the same question and wrong answer are coalesced into a single
+    request. Returns None if the model failed or timed out, so callers can fall back to
+    AI_HELP_FALLBACK without caching it.
     """
-    Generate a new set of questions based on a prompt and save to a YAML file.
+    key = (question, answerCorrect, answerIncorrect)
+    if key not in ai_help_requests:
+        task = asyncio.create_task(_request_ai_help(answerCorrect, answerIncorrect, question))
+        ai_help_requests[key] = task
+        task.add_done_callback(lambda _: ai_help_requests.pop(key, None))
+    # Shield so one player disconnecting doesn't cancel the request for everyone else waiting on it
+    return await asyncio.shield(ai_help_requests[key])
 
-    Args:
-        prompt (str): The input prompt for the AI to generate questions.
 
-    Returns:
-        str: A filepath (quizes/questions_uuid()) for the new set of questions.
-    """
+async def _request_ai_help(answerCorrect: str, answerIncorrect: str, question: str):
     try:
-        chat_completion = client.chat.completions.create(
+        async with asyncio.timeout(AI_HELP_TIMEOUT):
+            async with ai_help_semaphore:
+                return await _create_ai_help_completion(answerCorrect, answerIncorrect, question)
+    except TimeoutError:
+        logging.warning(f"AI help timed out after {AI_HELP_TIMEOUT}s")
+    except Exception as e:
+        logging.error(f"AI help failed: {e}")
+    return None
+
+
+async def _create_ai_help_completion(answerCorrect: str, answerIncorrect: str, question: str):
+    with LLM_REQUEST_SECONDS.labels("ai_help").time():
+        return await llm_provider.complete(
             messages=[
+                #{
+                #    "role": "system",
+                #    "content": "Provide hints and explanations without giving the answer. Be brief."
+                #},
                 {
                     "role": "user",
-                    "content": (
-                        "Generate a set of multiple-choice questions based on the following prompt. "
-                        "The number of questions should be specified if not default to 10"
-                        "Provide each question with options A, B, C, D, and the correct answer. "
-                        "Respond with the YAML output and nothing else. "
-                        "Output should be in YAML format:\n\n"
-                        "questions:\n"
-                        "  - question: \"Your question here\"\n"
-                        "    options:\n"
-                        "      A: \"Option A\"\n"
-                        "      B: \"Option B\"\n"
-                        "      C: \"Option C\"\n"
-                        "      D: \"Option D\"\n"
-                        "    answer: \"A\"\n\n"
-                        f"Prompt: {prompt}"
-                    )
+                    "content": f"Provide hints and help the user understand. Do not give the answer. Be brief. Don't give affirmations. Question: {question}\nCorrect Answer: {answerCorrect}\nUser's Answer: {answerIncorrect}"
                 }
             ],
-            model="llama3-8b-8192",
-            max_tokens=1000,
-            stream=False
+            max_tokens=100,
         )
 
 
-        questions_yaml = chat_completion.choices[0].message.content
-        output_file = os.path.join("quizzes", f"questions_{uuid.uuid4()}.yaml")
+def get_question_messages(prompt: str) -> list:
+    return [
+        {
+            "role": "user",
+            "content": (
+                "Generate a set of multiple-choice questions based on the following prompt. "
+                "The number of questions should be specified if not default to 10"
+                "Provide each question with options A, B, C, D, and the correct answer. "
+                "Respond with the YAML output and nothing else. "
+                "Output should be in YAML format:\n\n"
+                "questions:\n"
+                "  - question: \"Your question here\"\n"
+                "    options:\n"
+                "      A: \"Option A\"\n"
+                "      B: \"Option B\"\n"
+                "      C: \"Option C\"\n"
+                "      D: \"Option D\"\n"
+                "    answer: \"A\"\n\n"
+                f"Prompt: {prompt}"
+            )
+        }
+    ]
+
+
+async def generate_questions(prompt: str) -> str:
+    """
+    Generate a new set of questions based on a prompt.
+
+    Args:
+        prompt (str): The input prompt for the AI to generate questions.
+
+    Returns:
+        str: The YAML for the new set of questions, or None if generation failed.
+    """
+    try:
+        with LLM_REQUEST_SECONDS.labels("generate_questions").time():
+            return await llm_provider.complete(messages=get_question_messages(prompt), max_tokens=1000)
+
+    except Exception as e:
+        logging.error(f"Error generating questions: {e}")
+
+
+def parse_questions(questions_yaml: str) -> list:
+    """
+    Parse generated quiz YAML, keeping only questions that pass validate_question.
+
+    Raises:
+        yaml.YAMLError: If the output isn't valid YAML.
+    """
+    # Models sometimes wrap the output in a code fence
+    questions_yaml = re.sub(r"^\s*```\w*\s*$", "", questions_yaml, flags=re.MULTILINE)
+    quiz_yml = yaml.safe_load(questions_yaml)
+    if not isinstance(quiz_yml, dict) or not isinstance(quiz_yml.get("questions"), list):
+        return []
+    return [question for question in map(validate_question, quiz_yml["questions"]) if question]
 
-        with open(output_file, "w") as file:
-            file.write(questions_yaml)
 
-        return output_file
+def validate_question(question) -> dict:
+    """
+    Check a generated question has text, exactly four options and an answer that is one of
+    the option keys.
 
+    Returns:
+        dict: The question with its answer matched to the option key's casing, or None if invalid.
+    """
+    if not isinstance(question, dict) or not isinstance(question.get("question"), str) or not question["question"].strip():
+        return None
+    options = question.get("options")
+    if not isinstance(options, dict) or len(options) != 4:
+        return None
+    options = {str(key): str(value) for key, value in options.items()}
+    answer = str(question.get("answer", "")).strip()
+    answer = next((key for key in options if key.lower() == answer.lower()), None)
+    if answer is None:
+        return None
+    return {"question": question["question"], "options": options, "answer": answer}
+
+
+async def stream_questions(prompt: str):
+    """
+    Generate a new set of questions based on a prompt, yielding each question as soon as
+    the model has finished writing it.
+
+    Args:
+        prompt (str): The input prompt for the AI to generate questions.
+
+    Yields:
+        dict: A question with its options and answer.
+
+    Raises:
+        Exception: Whatever the provider or parser raised, after the questions yielded so far,
+            so callers can tell a cut-off quiz from a complete one.
+    """
+    parser = QuestionStreamParser()
+    try:
+        with LLM_REQUEST_SECONDS.labels("stream_questions").time():
+            async for text in llm_provider.stream(messages=get_question_messages(prompt), max_tokens=1000):
+                for question in parser.feed(text):
+                    yield question
     except Exception as e:
-        print(f"Error: {e}")
\ No newline at end of file
+        logging.error(f"Error streaming questions: {e}")
+        raise
+    for question in parser.close():
+        yield question
+
+
+class QuestionStreamParser:
+    """
+    Incremental parser for the YAML quiz format.
+
+    A "- question:" list item is parsed as soon as its answer follows its options, which is
+    the last field in the requested format, or otherwise once the next item starts.
+    """
+
+    ITEM_START = re.compile(r"^\s*-\s+question\s*:")
+    ITEM_OPTIONS = re.compile(r"^\s+options\s*:")
+    ITEM_ANSWER = re.compile(r"^\s+answer\s*:")
+
+    def __init__(self):
+        self.buffer = ""
+        self.item_lines = []
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        questions = []
+        for line in lines:
+            if self.ITEM_START.match(line):
+                questions.extend(self._flush_item())
+                self.item_lines.append(line)
+            elif self.item_lines and not line.strip().startswith("```"):
+                self.item_lines.append(line)
+                if self.ITEM_ANSWER.match(line) and any(self.ITEM_OPTIONS.match(l) for l in self.item_lines):
+                    questions.extend(self._flush_item())
+        return questions
+
+    def close(self) -> list:
+        questions = self.feed("\n")
+        return questions + self._flush_item()
+
+    def _flush_item(self) -> list:
+        if not self.item_lines:
+            return []
+        item = textwrap.dedent("\n".join(self.item_lines))
+        self.item_lines = []
+        try:
+            parsed = yaml.safe_load(item)
+        except yaml.YAMLError as e:
+            logging.error(f"Skipping malformed question: {e}")
+            return []
+        if not isinstance(parsed, list):
+            return []
+        return [question for question in map(validate_question, parsed) if question]
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+
+import httpx
+from groq import AsyncGroq
+
+
+# LLM_PROVIDER picks where completions come from: "groq", "openai" for any OpenAI-compatible
+# server (e.g. a local llama.cpp) or "fake" for canned answers that need no network
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3-8b-8192")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "http://localhost:8080/v1")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))
+FAKE_LLM_QUESTIONS = int(os.getenv("FAKE_LLM_QUESTIONS", "10"))
+
+
+class GroqProvider:
+    def __init__(self, model: str):
+        self.client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+        self.model = model
+
+    async def complete(self, messages: list, max_tokens: int) -> str:
+        chat_completion = await self.client.chat.completions.create(
+            messages=messages,
+            model=self.model,
+            max_tokens=max_tokens,
+            stream=False
+        )
+        return chat_completion.choices[0].message.content
+
+    async def stream(self, messages: list, max_tokens: int):
+        stream = await self.client.chat.completions.create(
+            messages=messages,
+            model=self.model,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        async for chunk in stream:
+            yield chunk.choices[0].delta.content or ""
+
+
+class OpenAICompatibleProvider:
+    """Talks to any server implementing the OpenAI chat completions API."""
+
+    def __init__(self, base_url: str, api_key: str, model: str):
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=LLM_TIMEOUT,
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else None,
+        )
+        self.model = model
+
+    async def complete(self, messages: list, max_tokens: int) -> str:
+        request = {"model": self.model, "messages": messages, "max_tokens": max_tokens, "stream": False}
+        response = await self.client.post("/chat/completions", json=request)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def stream(self, messages: list, max_tokens: int):
+        request = {"model": self.model, "messages": messages, "max_tokens": max_tokens, "stream": True}
+        async with self.client.stream("POST", "/chat/completions", json=request) as response:
+            response.raise_for_status()
+            # Server-sent events, one "data: {chunk}" line per chunk
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                yield json.loads(data)["choices"][0]["delta"].get("content") or ""
+
+
+class FakeProvider:
+    """
+    Deterministic in-process stand-in for offline runs and benchmarks.
+
+    A request for questions gets a quiz seeded from the prompt, anything else gets a fixed
+    hint. Every response is delayed by FAKE_LLM_LATENCY seconds.
+    """
+
+    def __init__(self, latency: float, num_questions: int):
+        self.latency = latency
+        self.num_questions = num_questions
+
+    def get_response(self, messages: list) -> str:
+        content = messages[-1]["content"]
+        if "questions:" not in content:
+            return "Think about what the question is really asking and rule out the options that don't fit."
+
+        seed = int(hashlib.sha256(content.encode("utf-8")).hexdigest(), 16)
+        rng = random.Random(seed)
+        lines = ["questions:"]
+        for i in range(self.num_questions):
+            lines += [
+                f"  - question: \"Question {i + 1} ({seed % 10000})?\"",
+                "    options:",
+                *(f"      {option}: \"Option {option}\"" for option in "ABCD"),
+                f"    answer: \"{rng.choice('ABCD')}\"",
+            ]
+        return "\n".join(lines) + "\n"
+
+    async def complete(self, messages: list, max_tokens: int) -> str:
+        await asyncio.sleep(self.latency)
+        return self.get_response(messages)
+
+    async def stream(self, messages: list, max_tokens: int):
+        lines = self.get_response(messages).splitlines(keepends=True)
+        for line in lines:
+            await asyncio.sleep(self.latency / len(lines))
+            yield line
+
+
+def create_llm_provider():
+    if LLM_PROVIDER == "groq":
+        return GroqProvider(LLM_MODEL)
+    if LLM_PROVIDER == "openai":
+        return OpenAICompatibleProvider(OPENAI_BASE_URL, OPENAI_API_KEY, LLM_MODEL)
+    if LLM_PROVIDER == "fake":
+        return FakeProvider(FAKE_LLM_LATENCY, FAKE_LLM_QUESTIONS)
+    raise RuntimeError(f"Unknown LLM_PROVIDER '{LLM_PROVIDER}'")
+
+
+llm_provider = create_llm_provider()
@@ -1,7 +1,7 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, BackgroundTasks, Query
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import redis
+import redis.asyncio
 import uuid
 import asyncio
 import logging
@@ -12,12 +12,43 @@ import os
 from yaml import safe_load, YAMLError
 import time
 from dotenv import load_dotenv
-
-app = FastAPI()
+from contextlib import asynccontextmanager
 
 load_dotenv()
 CORS_URL = os.getenv("CORS_URL")
 
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+
+# One bounded pool shared by every request and socket on this worker.
+# surrogateescape lets binary (msgpack) documents pass through the decoded responses intact.
+redis_pool = redis.asyncio.BlockingConnectionPool.from_url(
+    REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, decode_responses=True, encoding_errors="surrogateescape"
+)
+client = redis.asyncio.Redis(connection_pool=redis_pool)
+game_state_watcher = GameStateWatcher(client)
+game_sweeper = GameSweeper(client)
+answer_writer = AnswerWriter(client)
+answer_analytics = AnswerAnalytics(client)
+#id_to_websocket = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await game_state_watcher.start()
+    await answer_writer.start()
+    await game_sweeper.start()
+    await answer_analytics.start()
+    yield
+    await answer_analytics.stop()
+    await game_sweeper.stop()
+    await answer_writer.stop()
+    await game_state_watcher.stop()
+    await client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
 
 origins = []
 
@@ -26,45 +57,114 @@ if CORS_URL:
 
 app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
-client = redis.Redis("redis", port=6379, db=0)
-#id_to_websocket = {}
-active_hosts = {}
-
 
 # Create Game
 @app.post("/api/creategame")
-async def create_game(user_prompt: str):
+async def create_game(user_prompt: str, background_tasks: BackgroundTasks, stream: bool = False, live: bool = False):
+    # Reuse a cached quiz for the same prompt instead of generating it again
+    quiz_id = get_quiz_id(user_prompt)
+    quiz = await get_cached_quiz(client, quiz_id)
+    if quiz:
+        questions = quiz["questions"]
+    elif stream:
+        # Open the lobby right away and add questions as the model writes them
+        game_code = await setup_game([], background_tasks, generating=True, live=live)
+        background_tasks.add_task(generate_game_questions, game_code, quiz_id, user_prompt)
+        return {"game_code": game_code, "quiz_id": quiz_id, "message": "Game created successfully"}
+    else:
+        questions = await load_questions(user_prompt)
+        if not questions:
+            return JSONResponse(content={"message": "Error loading quiz file"}, status_code=500)
+        await save_cached_quiz(client, quiz_id, user_prompt, questions)
+        background_tasks.add_task(archive_questions, quiz_id, questions)
+
+    game_code = await setup_game(questions, background_tasks, live=live)
+    return {"game_code": game_code, "quiz_id": quiz_id, "message": "Game created successfully"}
+
+
+# Create Game from a stored quiz
+@app.post("/api/creategame/{quiz_id}")
+async def create_game_from_quiz(quiz_id: str, background_tasks: BackgroundTasks, live: bool = False):
+    quiz = await get_cached_quiz(client, quiz_id)
+    if not quiz:
+        return JSONResponse(content={"message": "Quiz not found"}, status_code=404)
+
+    game_code = await setup_game(quiz["questions"], background_tasks, live=live)
+    return {"game_code": game_code, "quiz_id": quiz_id, "message": "Game created successfully"}
+
+
+# List stored quizzes
+@app.get("/api/quizzes")
+async def list_quizzes():
+    return {"quizzes": await get_quiz_library(client)}
+
+
+async def setup_game(questions: list, background_tasks: BackgroundTasks, generating: bool = False, live: bool = False):
     game_code = generate_game_code()
-    questions = load_questions(user_prompt)
-    if not questions:
-        return JSONResponse(content={"message": "Error loading quiz file"}, status_code=500)
+    # Codes are short, so don't hand out one that a live game still holds
+    while await client.exists(f"game:{game_code}"):
+        game_code = generate_game_code()
+    game_data = init_game_data(game_code, questions, generating, live)
+    await save_game_data(client, game_code, game_data)
+    await save_game_state(client, game_code, STATUS_WAITING)
+    if AI_HELP_PREWARM and questions:
+        background_tasks.add_task(prewarm_ai_help, client, game_code, questions)
+    return game_code
+
+
+async def generate_game_questions(game_code: str, quiz_id: str, user_prompt: str):
+    questions = await stream_game_questions(client, game_code, user_prompt)
+    if questions:
+        await save_cached_quiz(client, quiz_id, user_prompt, questions)
+        await archive_questions(quiz_id, questions)
+        if AI_HELP_PREWARM:
+            await prewarm_ai_help(client, game_code, questions)
 
-    game_data = init_game_data(game_code, questions)
-    save_game_data(client, game_code, game_data)
-    save_game_state(client, game_code, STATUS_WAITING)
-    return {"game_code": game_code, "message": "Game created successfully"}
+
+# Prometheus metrics
+@app.get("/metrics")
+async def metrics():
+    body, content_type = get_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+# Per-question stats of a game, live or archived
+@app.get("/api/games/{game_code}/stats")
+async def game_stats(game_code: str):
+    question_stats = await get_question_stats(client, game_code)
+    if not question_stats:
+        summary = await client.get(get_game_summary_key(game_code))
+        question_stats = decode_document(summary).get("question_stats", {}) if summary else {}
+    return {"game_code": game_code, "question_stats": question_stats}
+
+
+# Logged answers of a game in commit order, for replaying it
+@app.get("/api/games/{game_code}/answers")
+async def game_answers(game_code: str, after: str = "-", count: int = Query(100, ge=1, le=1000)):
+    return {"game_code": game_code, "answers": await get_answer_log(client, game_code, after, count)}
 
 
 # Join Game
 @app.post("/api/joingame/{game_code}")
-async def join_game(game_code: str, player_name: str):
-    game_data = get_game_data(client, game_code)
+async def join_game(game_code: str, player_name: str, background_tasks: BackgroundTasks):
+    game_data = await get_game_data(client, game_code)
     if not game_data:
         return JSONResponse(content={"mesplayers_datasage": "Game not found"}, status_code=404)
     # If player is actively in game
-    players_data = get_players_data(client, game_code)
-    if players_data and player_name in players_data and players_data[player_name]["websocket_id"] is not None:
+    player_data = await get_player_data(client, game_code, player_name)
+    if player_data and player_data["websocket_id"] is not None:
         return JSONResponse(content={"message": "Player already in game"}, status_code=400)
 
     # If player is in game but got disconnected
-    if player_name in players_data and not players_data[player_name]["websocket_id"] is not None:
+    if player_data and not player_data["websocket_id"] is not None:
         return {"message": "Player reconnected"}
     
-    #players_data = get_game_data(client, game_code)
     # If player is new to game
-    register_player(client, game_code, player_name, game_data["questions"])
-    #save_players_data(client, game_code, players_data)
-    logging.info(f"Player '{player_name}' added to game '{game_code}'. Updated game data: {game_data}")
+    questions = await get_game_questions(client, game_code)
+    await register_player(client, game_code, player_name, len(questions), game_data.get("generating", False))
+    background_tasks.add_task(resolve_player_avatar, client, game_code, player_name)
+    logging.info(f"Player '{player_name}' added to game '{game_code}'")
+    log_payload(f"Game data for '{game_code}'", game_data)
 
     return {"message": "Joined game", "game_code": game_code, "player_name": player_name}
 
@@ -73,46 +173,41 @@ async def join_game(game_code: str, player_name: str):
 @app.websocket("/ws/game/{game_code}/{player_name}")
 async def game_websocket(websocket: WebSocket, game_code: str, player_name: str):
     await websocket.accept()
+    websocket_id = None
     try:
         logging.info(f"WebSocket connection established for player '{player_name}' in game '{game_code}'")
 
-        players_data = get_players_data(client, game_code)
-        if (not await validate_player(players_data, player_name, websocket)
-            or not players_data
-            or players_data[player_name]["websocket_id"] is not None):
+        player_data = await get_player_data(client, game_code, player_name)
+        if not await validate_player(player_data, player_name, websocket):
             return
 
         # Mutex for player connection
         websocket_id = str(uuid.uuid4())
-        players_data[player_name]["websocket_id"] = websocket_id
-
-        #id_to_websocket[players_data[player_name]["id"]] = websocket
-        
-        save_players_data(client, game_code, players_data)
-
-        # Handle game start and question/answer flow
-        game_state = get_game_state(client, game_code)
-        if game_state == STATUS_WAITING:
-            await wait_for_game_start(websocket, game_code)
-        elif game_state == STATUS_ENDED:
-            await websocket.send_text("[END]")
-            await websocket.close()
+        if not await claim_player_websocket(client, game_code, player_name, websocket_id):
+            websocket_id = None
             return
-        #elif game_state == STATUS_PAUSED:
-        #    await websocket.send_text("[PAUSE]")
-        elif game_state == STATUS_STARTED:
-            await websocket.send_text("[START]")
-        await manage_game_session(websocket, client, game_code, player_name)
+
+        with track_websocket("player"):
+            # Handle game start and question/answer flow
+            game_state = await get_game_state(client, game_code)
+            if game_state == STATUS_WAITING:
+                await wait_for_game_start(websocket, game_state_watcher, game_code)
+            elif game_state == STATUS_ENDED:
+                await websocket.send_text("[END]")
+                await websocket.close()
+                return
+            #elif game_state == STATUS_PAUSED:
+            #    await websocket.send_text("[PAUSE]")
+            elif game_state == STATUS_STARTED:
+                await websocket.send_text("[START]")
+            await manage_game_session(websocket, client, game_state_watcher, answer_writer, game_code, player_name)
     except WebSocketDisconnect:
         logging.info(f"Player '{player_name}' disconnected")
     except Exception as e:
         logging.error(f"Error in Player '{player_name}' websocket: {e}")
     finally:
-        players_data = get_players_data(client, game_code)
         # Only set player as disconnected if they match the mutex
-        if players_data and players_data[player_name]["websocket_id"] == websocket_id:
-            players_data[player_name]["websocket_id"] = None
-            save_players_data(client, game_code, players_data)
+        if websocket_id and await release_player_websocket(client, game_code, player_name, websocket_id):
             logging.info(f"Player '{player_name}' disconnected in game '{game_code}'")
 
 
@@ -121,33 +216,34 @@ async def game_websocket(websocket: WebSocket, game_code: str, player_name: str)
 async def host_websocket(websocket: WebSocket, game_code: str):
     await websocket.accept()
 
-    # Get this logic working when come back. Basically uses uuid as a mutex
+    # Holding the Redis host lease makes this socket the game's only host across every worker
     websocket_id = str(uuid.uuid4())
+    lease_acquired = False
 
     try:
         logging.info("Host joined")
 
-        game_data = get_game_data(client, game_code)
+        game_data = await get_game_data(client, game_code)
         if not game_data:
             await websocket.send_text("[GAME_NOT_FOUND]")
             await websocket.close()
             return
 
-        if game_code in active_hosts:
+        lease_acquired = await acquire_host_lease(client, game_code, websocket_id)
+        if not lease_acquired:
             await websocket.send_text("[HOST_ALREADY_CONNECTED]")
             await websocket.close()
             return
 
-        active_hosts[game_code] = websocket_id
-
-        await manage_host_session(websocket, client, game_code)
+        with track_websocket("host"):
+            await manage_host_session(websocket, client, game_state_watcher, game_code, websocket_id)
     except WebSocketDisconnect:
         logging.info("Host disconnected")
     except Exception as e:
         logging.error(f"Error in host websocket: {e}")
     finally:
-        if game_code in active_hosts and active_hosts[game_code] == websocket_id:
-            del active_hosts[game_code]
+        if lease_acquired:
+            await release_host_lease(client, game_code, websocket_id)
             logging.info("Host cleaned up")
         
 
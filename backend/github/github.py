@@ -1,7 +1,26 @@
-import requests
+import httpx
+import os
+import re
 
-def get_github_avatar(username: str) -> str:
-    response = requests.get(f"https://api.github.com/users/{username}")
-    if "avatar_url" not in response.json():
+# Point GITHUB_API_URL at a local stub to test without hitting the public API
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+GITHUB_API_TIMEOUT = float(os.getenv("GITHUB_API_TIMEOUT", "3"))
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+
+GITHUB_USERNAME_PATTERN = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9-]{0,38})$")
+
+github_client = httpx.AsyncClient(
+    base_url=GITHUB_API_URL,
+    timeout=GITHUB_API_TIMEOUT,
+    headers={"Authorization": f"Bearer {GITHUB_TOKEN}"} if GITHUB_TOKEN else None,
+)
+
+async def get_github_avatar(username: str) -> str:
+    """Returns the user's avatar url, or None if there is no such user. Raises httpx.HTTPError if GitHub can't be reached."""
+    if not GITHUB_USERNAME_PATTERN.match(username):
+        return None
+    response = await github_client.get(f"/users/{username}")
+    if response.status_code == 404:
         return None
-    return response.json()["avatar_url"]
\ No newline at end of file
+    response.raise_for_status()
+    return response.json().get("avatar_url")
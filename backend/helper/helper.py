@@ -1,6 +1,8 @@
 from typing import Dict
 from fastapi import WebSocket, WebSocketDisconnect
-from redis import Redis
+from starlette.websockets import WebSocketState
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError as RedisConnectionError, RedisError, ResponseError, WatchError
 import json
 import random
 import uuid
@@ -12,31 +14,390 @@ import asyncio
 import time
 from ai import *
 from github import *
+from telemetry import *
 import math
+import hashlib
+import httpx
 
 # Constants for game status
 STATUS_WAITING = "WAITING"
 STATUS_STARTED = "STARTED"
 STATUS_PAUSED = "PAUSED"
 STATUS_ENDED = "ENDED"
+GAME_STATUSES = (STATUS_WAITING, STATUS_STARTED, STATUS_PAUSED, STATUS_ENDED)
 
 NUM_ATTEMPTS = 2
+QUESTION_TIME_LIMIT = 30
+
+# Generate hints for every wrong option when a game is created instead of on the first miss
+AI_HELP_PREWARM = os.getenv("AI_HELP_PREWARM", "false").lower() == "true"
+AI_HELP_PREWARM_BATCH = int(os.getenv("AI_HELP_PREWARM_BATCH", "5"))
+
+
+# Serialization
+# Documents (the game, its questions, quizzes and summaries) are stored with GAME_DATA_CODEC
+# behind a header of "\x00" and a format tag, so values written as plain JSON before the header
+# existed, or with another codec, are still read correctly. Player and meta hash fields stay
+# JSON because the Lua scripts compare them, and counters stay plain numbers for HINCRBY.
+# msgpack values are binary, so the Redis client must decode with encoding_errors="surrogateescape".
+GAME_DATA_CODEC = os.getenv("GAME_DATA_CODEC", "json")
+DOCUMENT_HEADER = "\x00"
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+if GAME_DATA_CODEC not in ("json", "orjson", "msgpack"):
+    raise RuntimeError(f"Unknown GAME_DATA_CODEC '{GAME_DATA_CODEC}'")
+if GAME_DATA_CODEC == "orjson" and orjson is None or GAME_DATA_CODEC == "msgpack" and msgpack is None:
+    raise RuntimeError(f"GAME_DATA_CODEC is '{GAME_DATA_CODEC}' but it isn't installed")
+
+def encode_document(value) -> bytes:
+    if GAME_DATA_CODEC == "msgpack":
+        return b"\x00m" + msgpack.packb(value)
+    if GAME_DATA_CODEC == "orjson":
+        return b"\x00j" + orjson.dumps(value)
+    return b"\x00j" + json.dumps(value).encode("utf-8")
+
+def decode_document(value: str):
+    if not value.startswith(DOCUMENT_HEADER):
+        return json.loads(value)
+    tag, payload = value[1], value[2:]
+    if tag == "m":
+        return msgpack.unpackb(payload.encode("utf-8", "surrogateescape"))
+    return orjson.loads(payload) if orjson else json.loads(payload)
+
+
+# Lua scripts
+# Each script is registered once, when the module loads, and run with EVALSHA on whichever client
+# or pipeline is passed in. Redis only loads it again after a NOSCRIPT, e.g. following a restart.
+# The registry client never connects; it just gives the scripts an encoder for their SHA1.
+_script_registry = Redis()
+
+def register_script(script: str):
+    return _script_registry.register_script(script)
+
+def _queue_script(pipe, script, keys: list, args: list):
+    # Same as script(keys, args, client=pipe) without awaiting, so pipeline builders stay synchronous
+    pipe.scripts.add(script)
+    pipe.evalsha(script.sha, len(keys), *keys, *args)
 
 
 # Helper functions for Redis data retrieval
-def get_game_data(client: Redis, game_code: str):
-    game_data_bytes = client.get(f"game:{game_code}")
-    return json.loads(game_data_bytes) if game_data_bytes else {}
-
-def get_players_data(client: Redis, game_code: str):
-    player_data_bytes = client.get(f"game:{game_code}:players")
-    return json.loads(player_data_bytes) if player_data_bytes else {}
-
-def save_game_data(client: Redis, game_code: str, game_data: dict):
-    client.set(f"game:{game_code}", json.dumps(game_data))
-
-def save_players_data(client: Redis, game_code: str, players_data: dict):
-    client.set(f"game:{game_code}:players", json.dumps(players_data))
+# game:{code} holds the game code and a unique id for the game. Fields that change during a game (start_time, generating)
+# live in the game:{code}:meta hash, JSON-encoded like player fields, so state transitions can
+# update them without rewriting anything else. The questions are a list at game:{code}:questions,
+# one JSON item per question, which never changes once generation has finished.
+GAME_DOCUMENT_FIELDS = ("code", "id")
+QUESTION_CACHE_SIZE = int(os.getenv("QUESTION_CACHE_SIZE", "1000"))
+
+# Finished question banks by game id, so fetching a question is a local read. Codes are short
+# and get reused once a game is gone, and no other worker drops its entry when a game is archived,
+# so the code alone could serve an old game's questions.
+question_cache = {}
+
+def get_game_meta_key(game_code: str):
+    return f"game:{game_code}:meta"
+
+def get_questions_key(game_code: str):
+    return f"game:{game_code}:questions"
+
+@timed_redis
+async def get_game_data(client: Redis, game_code: str):
+    pipe = client.pipeline()
+    pipe.get(f"game:{game_code}")
+    pipe.hgetall(get_game_meta_key(game_code))
+    game_data_bytes, game_meta = await pipe.execute()
+    if not game_data_bytes:
+        return {}
+    game_data = decode_document(game_data_bytes)
+    game_data.update({field: json.loads(value) for field, value in game_meta.items() if field != "state_version"})
+    return game_data
+
+@timed_redis
+async def save_game_data(client: Redis, game_code: str, game_data: dict):
+    game_data = dict(game_data)
+    questions = game_data.pop("questions", [])
+    pipe = client.pipeline()
+    pipe.set(f"game:{game_code}", encode_document({field: game_data[field] for field in GAME_DOCUMENT_FIELDS}))
+    game_meta = {field: json.dumps(value) for field, value in game_data.items() if field not in GAME_DOCUMENT_FIELDS}
+    if game_meta:
+        pipe.hset(get_game_meta_key(game_code), mapping=game_meta)
+    pipe.delete(get_questions_key(game_code))
+    if questions:
+        pipe.rpush(get_questions_key(game_code), *(encode_document(question) for question in questions))
+    await pipe.execute()
+
+@timed_redis
+async def update_game_fields(client: Redis, game_code: str, **fields):
+    await client.hset(get_game_meta_key(game_code), mapping={k: json.dumps(v) for k, v in fields.items()})
+
+@timed_redis
+async def append_game_question(client: Redis, game_code: str, question: dict):
+    await client.rpush(get_questions_key(game_code), encode_document(question))
+
+@timed_redis
+async def get_game_questions(client: Redis, game_code: str):
+    game_data_bytes = await client.get(f"game:{game_code}")
+    if not game_data_bytes:
+        return []
+    game_document = decode_document(game_data_bytes)
+    game_id = game_document.get("id", game_code)
+    questions = question_cache.get(game_id)
+    if questions is not None:
+        return questions
+
+    pipe = client.pipeline()
+    pipe.lrange(get_questions_key(game_code), 0, -1)
+    pipe.hget(get_game_meta_key(game_code), "generating")
+    question_items, generating = await pipe.execute()
+    questions = [decode_document(question) for question in question_items]
+    # Games saved before the questions had their own list still embed them in the document
+    if not questions:
+        questions = game_document.get("questions", [])
+
+    # Questions still being generated can grow, so only a finished bank is cached
+    if questions and generating != "true":
+        if len(question_cache) >= QUESTION_CACHE_SIZE:
+            del question_cache[next(iter(question_cache))]
+        question_cache[game_id] = questions
+    return questions
+
+
+# Game lifecycle
+# The games sorted set holds every live game scored by its last activity. Every key of a game
+# expires GAME_TTL seconds after its last activity, so abandoned games clean themselves up.
+# Ended games are summarized to game_summary:{code} and deleted GAME_ENDED_GRACE seconds later.
+GAMES_KEY = "games"
+GAME_TTL = int(os.getenv("GAME_TTL", str(24 * 60 * 60)))
+GAME_ENDED_GRACE = int(os.getenv("GAME_ENDED_GRACE", str(10 * 60)))
+GAME_SUMMARY_TTL = int(os.getenv("GAME_SUMMARY_TTL", str(30 * 24 * 60 * 60)))
+GAME_SWEEP_INTERVAL = int(os.getenv("GAME_SWEEP_INTERVAL", "60"))
+
+def get_game_summary_key(game_code: str):
+    return f"game_summary:{game_code}"
+
+def _queue_game_active(pipe, game_code: str):
+    pipe.zadd(GAMES_KEY, {game_code: time.time()})
+
+
+# Player storage
+# game:{code}:players is a sorted set of player names (scored by join time). Each player
+# lives in its own hash at game:{code}:player:{name}, with the question lists kept as
+# Redis lists next to it, so an answer only touches that player's keys.
+PLAYER_LIST_FIELDS = ("remaining_questions", "correct_questions", "incorrect_questions")
+
+def get_players_key(game_code: str):
+    return f"game:{game_code}:players"
+
+def get_player_key(game_code: str, player_name: str):
+    return f"game:{game_code}:player:{player_name}"
+
+def get_player_list_key(game_code: str, player_name: str, field: str):
+    return f"game:{game_code}:player:{player_name}:{field}"
+
+# Players ranked by average score per answered question
+def get_leaderboard_key(game_code: str):
+    return f"game:{game_code}:leaderboard"
+
+# Host metrics are sent as deltas: every change to a player's metrics bumps the game's
+# metrics version and records it against the player in the metrics_changes sorted set
+def get_metrics_version_key(game_code: str):
+    return f"game:{game_code}:metrics_version"
+
+def get_metrics_changes_key(game_code: str):
+    return f"game:{game_code}:metrics_changes"
+
+MARK_PLAYER_CHANGED_SCRIPT = register_script("""
+local version = redis.call('INCR', KEYS[1])
+redis.call('ZADD', KEYS[2], version, ARGV[1])
+return version
+""")
+
+def _queue_player_changed(pipe, game_code: str, player_name: str):
+    _queue_script(pipe, MARK_PLAYER_CHANGED_SCRIPT, [get_metrics_version_key(game_code), get_metrics_changes_key(game_code)], [player_name])
+    _queue_game_active(pipe, game_code)
+
+def _queue_player_write(pipe, game_code: str, player_name: str, player_data: dict, joined_at: float):
+    fields = {k: json.dumps(v) for k, v in player_data.items() if k not in PLAYER_LIST_FIELDS}
+    pipe.zadd(get_players_key(game_code), {player_name: joined_at})
+    answered = len(player_data.get("correct_questions", [])) + len(player_data.get("incorrect_questions", []))
+    pipe.zadd(get_leaderboard_key(game_code), {player_name: player_data["score"] / answered if answered else 0})
+    pipe.delete(get_player_key(game_code, player_name))
+    pipe.hset(get_player_key(game_code, player_name), mapping=fields)
+    for field in PLAYER_LIST_FIELDS:
+        list_key = get_player_list_key(game_code, player_name, field)
+        pipe.delete(list_key)
+        if player_data.get(field):
+            pipe.rpush(list_key, *player_data[field])
+    _queue_player_changed(pipe, game_code, player_name)
+
+def _parse_player_data(fields: dict, lists: list):
+    player_data = {k: json.loads(v) for k, v in fields.items()}
+    for field, values in zip(PLAYER_LIST_FIELDS, lists):
+        player_data[field] = [int(v) for v in values]
+    return player_data
+
+@timed_redis
+async def migrate_players_data(client: Redis, game_code: str):
+    """One-time conversion of the legacy JSON blob at game:{code}:players into per-player hashes."""
+    key = get_players_key(game_code)
+    async with client.pipeline() as pipe:
+        try:
+            await pipe.watch(key)
+            if await pipe.type(key) != "string":
+                return
+            legacy_players = json.loads(await pipe.get(key))
+            pipe.multi()
+            pipe.delete(key)
+            # Keep the original join order
+            for position, (player_name, player_data) in enumerate(legacy_players.items()):
+                _queue_player_write(pipe, game_code, player_name, player_data, position)
+            await pipe.execute()
+            logging.info(f"Migrated {len(legacy_players)} players in game '{game_code}' to per-player hashes")
+        except WatchError:
+            # Another worker migrated it first
+            pass
+
+@timed_redis
+async def get_player_names(client: Redis, game_code: str):
+    try:
+        return await client.zrange(get_players_key(game_code), 0, -1)
+    except ResponseError:
+        # WRONGTYPE: game still uses the legacy blob format
+        await migrate_players_data(client, game_code)
+        return await client.zrange(get_players_key(game_code), 0, -1)
+
+@timed_redis
+async def player_in_game(client: Redis, game_code: str, player_name: str):
+    try:
+        joined_at = await client.zscore(get_players_key(game_code), player_name)
+    except ResponseError:
+        await migrate_players_data(client, game_code)
+        joined_at = await client.zscore(get_players_key(game_code), player_name)
+    return joined_at is not None
+
+@timed_redis
+async def get_player_data(client: Redis, game_code: str, player_name: str):
+    if not await player_in_game(client, game_code, player_name):
+        return {}
+    pipe = client.pipeline(transaction=False)
+    pipe.hgetall(get_player_key(game_code, player_name))
+    for field in PLAYER_LIST_FIELDS:
+        pipe.lrange(get_player_list_key(game_code, player_name, field), 0, -1)
+    fields, *lists = await pipe.execute()
+    return _parse_player_data(fields, lists)
+
+@timed_redis
+async def get_players_data(client: Redis, game_code: str, player_names: list = None):
+    if player_names is None:
+        player_names = await get_player_names(client, game_code)
+    pipe = client.pipeline(transaction=False)
+    for player_name in player_names:
+        pipe.hgetall(get_player_key(game_code, player_name))
+        for field in PLAYER_LIST_FIELDS:
+            pipe.lrange(get_player_list_key(game_code, player_name, field), 0, -1)
+    results = await pipe.execute()
+
+    players_data = {}
+    step = 1 + len(PLAYER_LIST_FIELDS)
+    for i, player_name in enumerate(player_names):
+        fields, *lists = results[i * step:(i + 1) * step]
+        players_data[player_name] = _parse_player_data(fields, lists)
+    return players_data
+
+@timed_redis
+async def save_player_data(client: Redis, game_code: str, player_name: str, player_data: dict):
+    pipe = client.pipeline()
+    _queue_player_write(pipe, game_code, player_name, player_data, time.time())
+    await pipe.execute()
+
+def _queue_player_fields(pipe, game_code: str, player_name: str, fields: dict):
+    pipe.hset(get_player_key(game_code, player_name), mapping={k: json.dumps(v) for k, v in fields.items()})
+
+@timed_redis
+async def update_player_fields(client: Redis, game_code: str, player_name: str, **fields):
+    pipe = client.pipeline()
+    _queue_player_fields(pipe, game_code, player_name, fields)
+    await pipe.execute()
+
+def _queue_next_question(pipe, game_code: str, player_name: str, question_index: int, start_time: float):
+    """Moves a question from the player's remaining list to their current question."""
+    pipe.lrem(get_player_list_key(game_code, player_name, "remaining_questions"), -1, question_index)
+    _queue_player_fields(pipe, game_code, player_name, {"current_question_index": question_index, "question_start_time": start_time})
+    _queue_player_changed(pipe, game_code, player_name)
+
+@timed_redis
+async def get_metrics_version(client: Redis, game_code: str):
+    return int(await client.get(get_metrics_version_key(game_code)) or 0)
+
+@timed_redis
+async def get_changed_players(client: Redis, game_code: str, since_version: int):
+    """Players whose metrics changed after since_version, and the latest version seen."""
+    changes = await client.zrangebyscore(get_metrics_changes_key(game_code), f"({since_version}", "+inf", withscores=True)
+    return [player_name for player_name, _ in changes], int(max((version for _, version in changes), default=since_version))
+
+# Records a question result and re-scores the player on the leaderboard in one atomic step
+FINISH_QUESTION_SCRIPT = register_script("""
+redis.call('RPUSH', KEYS[2], ARGV[1])
+local score = redis.call('HINCRBY', KEYS[1], 'score', ARGV[2])
+redis.call('HSET', KEYS[1], 'current_question_index', '-1', 'question_attempt', '0', 'question_start_time', 'null')
+local answered = redis.call('LLEN', KEYS[3]) + redis.call('LLEN', KEYS[4])
+redis.call('ZADD', KEYS[5], tostring(score / answered), ARGV[3])
+local version = redis.call('INCR', KEYS[6])
+redis.call('ZADD', KEYS[7], version, ARGV[3])
+redis.call('ZADD', KEYS[8], ARGV[5], ARGV[4])
+redis.call('LREM', KEYS[9], 0, ARGV[1])
+return score
+""")
+
+def _queue_finish_question(pipe, game_code: str, player_name: str, question_index: int, correct: bool, points: int = 0):
+    """Records the result of the player's current question, clears it and updates the leaderboard."""
+    field = "correct_questions" if correct else "incorrect_questions"
+    keys = [
+        get_player_key(game_code, player_name),
+        get_player_list_key(game_code, player_name, field),
+        get_player_list_key(game_code, player_name, "correct_questions"),
+        get_player_list_key(game_code, player_name, "incorrect_questions"),
+        get_leaderboard_key(game_code),
+        get_metrics_version_key(game_code),
+        get_metrics_changes_key(game_code),
+        GAMES_KEY,
+        # Live rounds don't pop questions, so the result also takes it off the remaining list
+        get_player_list_key(game_code, player_name, "remaining_questions"),
+    ]
+    _queue_script(pipe, FINISH_QUESTION_SCRIPT, keys, [question_index, points, player_name, game_code, time.time()])
+
+# websocket_id is used as a mutex so a player can only have one connected socket
+CLAIM_WEBSOCKET_SCRIPT = register_script("""
+if redis.call('HGET', KEYS[1], 'websocket_id') == 'null' then
+    redis.call('HSET', KEYS[1], 'websocket_id', ARGV[1])
+    return 1
+end
+return 0
+""")
+
+RELEASE_WEBSOCKET_SCRIPT = register_script("""
+if redis.call('HGET', KEYS[1], 'websocket_id') == ARGV[1] then
+    redis.call('HSET', KEYS[1], 'websocket_id', 'null')
+    return 1
+end
+return 0
+""")
+
+@timed_redis
+async def claim_player_websocket(client: Redis, game_code: str, player_name: str, websocket_id: str):
+    return bool(await CLAIM_WEBSOCKET_SCRIPT(keys=[get_player_key(game_code, player_name)], args=[json.dumps(websocket_id)], client=client))
+
+@timed_redis
+async def release_player_websocket(client: Redis, game_code: str, player_name: str, websocket_id: str):
+    return bool(await RELEASE_WEBSOCKET_SCRIPT(keys=[get_player_key(game_code, player_name)], args=[json.dumps(websocket_id)], client=client))
 
 # DEPRICATED
 #def set_game_status(client: Redis, game_code: str, status: str):
@@ -45,53 +406,732 @@ def save_players_data(client: Redis, game_code: str, players_data: dict):
 #        game_data["status"] = status
 #        client.set(f"game:{game_code}", json.dumps(game_data))
 
-def get_game_state(client: Redis, game_code: str):
-    state_data = client.get(f"game:{game_code}:state")
-    # Have to decode as utf-8 string as it is stored as bytes stirng type in redis
-    # Also need to remove the '"' as it comes encoded
-    return state_data.decode('utf-8').strip('"') if state_data else None
-
-def save_game_state(client: Redis, game_code: str, state_data: str):
-    client.set(f"game:{game_code}:state", json.dumps(state_data))
-
-def get_ai_response_cache(client: Redis, game_code: str):
-    question_cache = client.get(f"game:{game_code}:question_responses")
-    return json.loads(question_cache) if question_cache else {}
+@timed_redis
+async def get_game_state(client: Redis, game_code: str):
+    state_data = await client.get(f"game:{game_code}:state")
+    # Need to remove the '"' as it comes encoded
+    return state_data.strip('"') if state_data else None
+
+def get_game_events_channel(game_code: str):
+    return f"game:{game_code}:events"
+
+@timed_redis
+async def save_game_state(client: Redis, game_code: str, state_data: str):
+    # Publish in the same transaction so subscribers never see a state that isn't stored yet
+    pipe = client.pipeline()
+    pipe.set(f"game:{game_code}:state", json.dumps(state_data))
+    pipe.publish(get_game_events_channel(game_code), json.dumps({"state": state_data}))
+    _queue_game_active(pipe, game_code)
+    await pipe.execute()
+
+# Host commands and the states they may be applied in. The check, the state, start_time and
+# pause clock writes, the version bump and the publish all happen in one script, so concurrent hosts or
+# workers can't interleave a transition.
+GAME_TRANSITIONS = {
+    "start": (STATUS_STARTED, (STATUS_WAITING,)),
+    "pause": (STATUS_PAUSED, (STATUS_STARTED,)),
+    "resume": (STATUS_STARTED, (STATUS_PAUSED,)),
+    "end": (STATUS_ENDED, GAME_STATUSES),
+}
+TRANSITION_REJECTED = 0
+TRANSITION_GENERATING = -1
+
+TRANSITION_GAME_STATE_SCRIPT = register_script("""
+local state = redis.call('GET', KEYS[1])
+local allowed = false
+for i = 6, #ARGV do
+    if state == ARGV[i] then
+        allowed = true
+    end
+end
+if not allowed then
+    return 0
+end
+if ARGV[3] ~= '' then
+    if redis.call('HGET', KEYS[2], 'generating') == 'true' then
+        return -1
+    end
+    redis.call('HSET', KEYS[2], 'start_time', ARGV[3])
+end
+local paused_at = redis.call('HGET', KEYS[2], 'paused_at')
+local paused_total = redis.call('HGET', KEYS[2], 'paused_total') or '0'
+if paused_at and paused_at ~= 'null' then
+    paused_total = redis.call('HINCRBYFLOAT', KEYS[2], 'paused_total', tostring(tonumber(ARGV[4]) - tonumber(paused_at)))
+end
+paused_at = 'null'
+if ARGV[1] == '"PAUSED"' then
+    paused_at = ARGV[4]
+end
+redis.call('HSET', KEYS[2], 'paused_at', paused_at)
+redis.call('SET', KEYS[1], ARGV[1])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[5])
+local version = redis.call('HINCRBY', KEYS[2], 'state_version', 1)
+local clock = '{"paused_total": ' .. paused_total .. ', "paused_at": ' .. paused_at .. '}'
+redis.call('PUBLISH', ARGV[2], '{"state": ' .. ARGV[1] .. ', "version": ' .. version .. ', "clock": ' .. clock .. '}')
+return version
+""")
+
+@timed_redis
+async def transition_game_state(client: Redis, game_code: str, command: str):
+    """Applies a host command. Returns the new state version, TRANSITION_REJECTED or TRANSITION_GENERATING."""
+    game_state, previous_states = GAME_TRANSITIONS[command]
+    start_time = json.dumps(time.time()) if command == "start" else ""
+    return await TRANSITION_GAME_STATE_SCRIPT(
+        keys=[f"game:{game_code}:state", get_game_meta_key(game_code), GAMES_KEY],
+        args=[json.dumps(game_state), get_game_events_channel(game_code), start_time, time.time(), game_code,
+              *(json.dumps(state) for state in previous_states)],
+        client=client,
+    )
 
-def save_ai_response_cache(client: Redis, game_code: str, user_answer: str, question_id: int, response: str):
-    question_cache = get_ai_response_cache(client, game_code)
-    question_id = str(question_id)
-    if question_id not in question_cache:
-        question_cache[question_id] = {}
+# Game clock
+# Question deadlines run on game time, which stands still while the game is paused. The
+# transition script keeps the total time spent paused and when the current pause began in
+# the game's meta hash, so any worker can work out game time without asking anyone else.
+def get_game_time(clock: dict, now: float = None):
+    now = time.time() if now is None else now
+    paused_at = clock.get("paused_at")
+    return (paused_at if paused_at is not None else now) - clock.get("paused_total", 0)
+
+@timed_redis
+async def get_game_clock(client: Redis, game_code: str):
+    paused_total, paused_at = await client.hmget(get_game_meta_key(game_code), "paused_total", "paused_at")
+    return {
+        "paused_total": float(paused_total) if paused_total else 0,
+        "paused_at": json.loads(paused_at) if paused_at else None,
+    }
 
-    if user_answer not in question_cache[question_id]:
-        question_cache[question_id][user_answer] = response
-    client.set(f"game:{game_code}:question_responses", json.dumps(question_cache))
+# Live shows
+# In a live game the host moves the whole room through the questions together. The host's
+# worker encodes each round's question frame once and publishes it, and every worker sends
+# that same frame to all of its players. Each player's first answer is counted per option.
+def get_option_counts_key(game_code: str):
+    return f"game:{game_code}:option_counts"
+
+def encode_question_frame(question: dict, start_time: float, questions_remaining: int, total_questions: int):
+    # Don't send correct answer to player
+    question = {key: value for key, value in question.items() if key != "answer"}
+    question['start_time'] = start_time
+    question['questions_remaining'] = questions_remaining
+    question['total_questions'] = total_questions
+    return json.dumps({"question": question})
+
+@timed_redis
+async def start_live_round(client: Redis, game_code: str, question_index: int, questions: list, start_time: float):
+    """Stores the live game's current round and broadcasts its question. start_time is in game time."""
+    live_round = {"question_index": question_index, "start_time": start_time}
+    frame = encode_question_frame(questions[question_index], time.time(), len(questions) - question_index - 1, len(questions))
+    pipe = client.pipeline()
+    pipe.hset(get_game_meta_key(game_code), "live_round", json.dumps(live_round))
+    pipe.publish(get_game_events_channel(game_code), json.dumps({"command": "round", **live_round, "frame": frame}))
+    _queue_game_active(pipe, game_code)
+    await pipe.execute()
+    return live_round
+
+def _queue_option_count(pipe, game_code: str, question_index: int, option: str):
+    pipe.hincrby(get_option_counts_key(game_code), f"{question_index}:{option}", 1)
+
+@timed_redis
+async def get_option_counts(client: Redis, game_code: str):
+    """Answer counts by question index, then option."""
+    option_counts = {}
+    for field, count in (await client.hgetall(get_option_counts_key(game_code))).items():
+        question_index, _, option = field.partition(":")
+        option_counts.setdefault(question_index, {})[option] = int(count)
+    return option_counts
+
+
+# Host lease
+# Only one host socket may own a game. The owner holds game:{code}:host with a TTL and keeps
+# renewing it, so a host on a crashed node is released after HOST_LEASE_TTL seconds.
+HOST_LEASE_TTL = int(os.getenv("HOST_LEASE_TTL", "15"))
+
+RENEW_HOST_LEASE_SCRIPT = register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+""")
+
+RELEASE_HOST_LEASE_SCRIPT = register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+def get_host_lease_key(game_code: str):
+    return f"game:{game_code}:host"
+
+@timed_redis
+async def acquire_host_lease(client: Redis, game_code: str, websocket_id: str):
+    return bool(await client.set(get_host_lease_key(game_code), websocket_id, nx=True, px=HOST_LEASE_TTL * 1000))
+
+@timed_redis
+async def renew_host_lease(client: Redis, game_code: str, websocket_id: str):
+    return bool(await RENEW_HOST_LEASE_SCRIPT(keys=[get_host_lease_key(game_code)], args=[websocket_id, HOST_LEASE_TTL * 1000], client=client))
+
+@timed_redis
+async def release_host_lease(client: Redis, game_code: str, websocket_id: str):
+    return bool(await RELEASE_HOST_LEASE_SCRIPT(keys=[get_host_lease_key(game_code)], args=[websocket_id], client=client))
+
+
+# Question timers
+# Seconds per timer wheel tick, which is also how late a question may time out
+QUESTION_TIMER_TICK = float(os.getenv("QUESTION_TIMER_TICK", "0.1"))
+TIMER_WHEEL_BITS = 6
+TIMER_WHEEL_SLOTS = 1 << TIMER_WHEEL_BITS
+TIMER_WHEEL_LEVELS = 3
+
+
+class QuestionTimer:
+    __slots__ = ("game_code", "expires", "remaining", "bucket", "future")
+
+    def __init__(self, game_code: str, future: asyncio.Future):
+        self.game_code = game_code
+        self.expires = 0
+        self.remaining = 0
+        self.bucket = None
+        self.future = future
+
+
+class QuestionTimerWheel:
+    """
+    Hierarchical timer wheel that owns every question deadline on this worker.
+
+    Each level has TIMER_WHEEL_SLOTS slots and each slot of a level spans a whole turn of the
+    level below, so a timer is bucketed by how far away it is and moved down a level as it
+    gets closer. One ticker task advances the wheel and resolves every timer that is due on
+    a tick together, however many sockets are waiting. Timers of a paused game are taken
+    out of the wheel with their remaining ticks and put back when it resumes.
+    """
+
+    def __init__(self, tick: float):
+        self.tick = tick
+        self.current_tick = 0
+        self.levels = [[set() for _ in range(TIMER_WHEEL_SLOTS)] for _ in range(TIMER_WHEEL_LEVELS)]
+        self.overflow = set()
+        self.games = {}
+        self.paused_games = set()
+        self.ticker = None
+
+    async def start(self):
+        self.ticker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.ticker:
+            self.ticker.cancel()
+            self.ticker = None
+
+    def schedule(self, game_code: str, delay: float, paused: bool = False):
+        """Returns a timer whose future resolves after delay seconds of unpaused game time."""
+        timer = QuestionTimer(game_code, asyncio.get_running_loop().create_future())
+        timer.remaining = max(math.ceil(delay / self.tick), 1)
+        self.games.setdefault(game_code, set()).add(timer)
+        if paused:
+            self.paused_games.add(game_code)
+        if game_code not in self.paused_games:
+            self._insert(timer, self.current_tick + timer.remaining)
+        return timer
+
+    def cancel(self, timer: QuestionTimer):
+        self._remove(timer)
+        timers = self.games.get(timer.game_code, set())
+        timers.discard(timer)
+        if not timers:
+            self.games.pop(timer.game_code, None)
+        if not timer.future.done():
+            timer.future.cancel()
+
+    def remaining(self, timer: QuestionTimer):
+        """Seconds of game time left on the timer."""
+        if timer.future.done():
+            return 0
+        if timer.bucket is None:
+            return timer.remaining * self.tick
+        return max(timer.expires - self.current_tick, 0) * self.tick
+
+    def pause_game(self, game_code: str):
+        if game_code in self.paused_games:
+            return
+        self.paused_games.add(game_code)
+        for timer in self.games.get(game_code, ()):
+            if timer.bucket is not None:
+                timer.remaining = max(timer.expires - self.current_tick, 1)
+                self._remove(timer)
+
+    def resume_game(self, game_code: str):
+        if game_code not in self.paused_games:
+            return
+        self.paused_games.discard(game_code)
+        for timer in self.games.get(game_code, ()):
+            if timer.bucket is None and not timer.future.done():
+                self._insert(timer, self.current_tick + timer.remaining)
+
+    def forget_game(self, game_code: str):
+        """Drops the paused flag of a game this worker no longer has sockets for."""
+        if game_code not in self.games:
+            self.paused_games.discard(game_code)
+
+    def _insert(self, timer: QuestionTimer, expires: int):
+        timer.expires = expires
+        delta = timer.expires - self.current_tick
+        for level in range(TIMER_WHEEL_LEVELS):
+            if delta < 1 << (TIMER_WHEEL_BITS * (level + 1)):
+                slot = (timer.expires >> (TIMER_WHEEL_BITS * level)) & (TIMER_WHEEL_SLOTS - 1)
+                timer.bucket = self.levels[level][slot]
+                break
+        else:
+            timer.bucket = self.overflow
+        timer.bucket.add(timer)
+
+    def _remove(self, timer: QuestionTimer):
+        if timer.bucket is not None:
+            timer.bucket.discard(timer)
+            timer.bucket = None
+
+    def _advance(self):
+        """Moves the wheel on one tick and returns the timers that are due."""
+        self.current_tick += 1
+        # At the start of each turn of a level, spread the next slot of the level above over it
+        if self.current_tick & ((1 << (TIMER_WHEEL_BITS * TIMER_WHEEL_LEVELS)) - 1) == 0:
+            self._cascade(self.overflow)
+        for level in range(TIMER_WHEEL_LEVELS - 1, 0, -1):
+            if self.current_tick & ((1 << (TIMER_WHEEL_BITS * level)) - 1) == 0:
+                self._cascade(self.levels[level][(self.current_tick >> (TIMER_WHEEL_BITS * level)) & (TIMER_WHEEL_SLOTS - 1)])
+
+        due = self.levels[0][self.current_tick & (TIMER_WHEEL_SLOTS - 1)]
+        self.levels[0][self.current_tick & (TIMER_WHEEL_SLOTS - 1)] = set()
+        for timer in due:
+            timer.bucket = None
+            timer.remaining = 0
+        return due
+
+    def _cascade(self, bucket: set):
+        timers = list(bucket)
+        bucket.clear()
+        for timer in timers:
+            self._insert(timer, timer.expires)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        while True:
+            # Sleep to the next tick boundary so ticks don't drift, and catch up on any the loop missed
+            await asyncio.sleep(started + (self.current_tick + 1) * self.tick - loop.time())
+            due = []
+            while self.current_tick < int((loop.time() - started) / self.tick):
+                due.extend(self._advance())
+            for timer in due:
+                timers = self.games.get(timer.game_code, set())
+                timers.discard(timer)
+                if not timers:
+                    self.games.pop(timer.game_code, None)
+                if not timer.future.done():
+                    timer.future.set_result(None)
+
+
+class GameStateWatcher:
+    """
+    One Redis subscriber per worker process that fans game state changes out to local sockets.
+
+    Sockets wait on an asyncio.Event per game instead of polling get_game_state, so a pause,
+    resume or end reaches every local player as soon as it is published. Commands published on
+    the game's events channel, such as live rounds, are put on the queue of every local subscriber
+    to the game.
+
+    The watcher also owns the worker's question timer wheel and the clocks of the games it
+    tracks, pausing and resuming their timers as the transitions arrive.
+    """
+
+    def __init__(self, client: Redis):
+        self.client = client
+        self.listener = None
+        self.states = {}
+        self.events = {}
+        self.watchers = {}
+        self.subscribers = {}
+        self.clocks = {}
+        self.timers = QuestionTimerWheel(QUESTION_TIMER_TICK)
+
+    async def start(self):
+        await self.timers.start()
+        self.listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+            self.listener = None
+        await self.timers.stop()
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.psubscribe(get_game_events_channel("*"))
+                    # Anything published while we were disconnected was missed, re-read tracked games
+                    for game_code in list(self.events):
+                        clock = await get_game_clock(self.client, game_code)
+                        self._set_state(game_code, await get_game_state(self.client, game_code), clock)
+                    async for message in pubsub.listen():
+                        game_code = message["channel"].split(":")[1]
+                        event = json.loads(message["data"])
+                        if "state" in event:
+                            self._set_state(game_code, event["state"], event.get("clock"))
+                        if "command" in event:
+                            for queue in self.subscribers.get(game_code, ()):
+                                queue.put_nowait(event)
+            except RedisConnectionError as e:
+                logging.error(f"Lost game state subscription, reconnecting: {e}")
+                await asyncio.sleep(1)
 
+    def _set_state(self, game_code: str, state: str, clock: dict = None):
+        # Only games with local sockets are tracked
+        if game_code not in self.events:
+            return
+        self.states[game_code] = state
+        if clock is not None:
+            self.clocks[game_code] = clock
+        if state == STATUS_PAUSED:
+            self.timers.pause_game(game_code)
+        elif state == STATUS_STARTED:
+            self.timers.resume_game(game_code)
+        # Wake everyone waiting on the previous event and start a fresh one for the next change
+        self.events.pop(game_code).set()
+        self.events[game_code] = asyncio.Event()
+
+    def subscribe(self, game_code: str):
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(game_code, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, game_code: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(game_code, set())
+        queues.discard(queue)
+        if not queues:
+            self.subscribers.pop(game_code, None)
+
+    async def get_state(self, game_code: str):
+        if game_code in self.states and self.states[game_code] is not None:
+            return self.states[game_code]
+        return await get_game_state(self.client, game_code)
+
+    def schedule_timer(self, game_code: str, delay: float, game_state: str):
+        """Starts a question timer, paused if the game is. game_state is only used for untracked games."""
+        if self.states.get(game_code) is not None:
+            game_state = self.states[game_code]
+        return self.timers.schedule(game_code, delay, paused=game_state == STATUS_PAUSED)
+
+    async def get_game_time(self, game_code: str):
+        clock = self.clocks.get(game_code)
+        if clock is None:
+            clock = await get_game_clock(self.client, game_code)
+        return get_game_time(clock)
+
+    async def wait_for_change(self, game_code: str, game_state: str):
+        """Waits until the game leaves the given state and returns the new one."""
+        return await self.wait_for_state(game_code, tuple(state for state in GAME_STATUSES if state != game_state))
+
+    async def wait_for_state(self, game_code: str, states: tuple):
+        """Waits until the game is in one of the given states and returns it."""
+        self.watchers[game_code] = self.watchers.get(game_code, 0) + 1
+        try:
+            if game_code not in self.events:
+                event = self.events[game_code] = asyncio.Event()
+                self.states[game_code] = None
+                clock = await get_game_clock(self.client, game_code)
+                game_state = await get_game_state(self.client, game_code)
+                # A published transition beats what we read
+                if self.events[game_code] is event:
+                    self._set_state(game_code, game_state, clock)
+
+            game_state = self.states[game_code]
+            while game_state not in states:
+                await self.events[game_code].wait()
+                game_state = self.states[game_code]
+            return game_state
+        finally:
+            self.watchers[game_code] -= 1
+            if self.watchers[game_code] == 0:
+                del self.watchers[game_code]
+                del self.events[game_code]
+                del self.states[game_code]
+                self.clocks.pop(game_code, None)
+                self.timers.forget_game(game_code)
+
+def get_game_keys(game_code: str, player_names: list):
+    """Every key of a game that lives as long as the game does."""
+    keys = [
+        f"game:{game_code}",
+        get_game_meta_key(game_code),
+        get_questions_key(game_code),
+        f"game:{game_code}:state",
+        get_players_key(game_code),
+        get_leaderboard_key(game_code),
+        get_metrics_version_key(game_code),
+        get_metrics_changes_key(game_code),
+        get_option_counts_key(game_code),
+        get_answers_key(game_code),
+        get_question_stats_key(game_code),
+        get_hints_key(game_code),
+    ]
+    for player_name in player_names:
+        keys.append(get_player_key(game_code, player_name))
+        keys.extend(get_player_list_key(game_code, player_name, field) for field in PLAYER_LIST_FIELDS)
+    return keys
+
+@timed_redis
+async def refresh_game_ttl(client: Redis, game_code: str):
+    player_names = await get_player_names(client, game_code)
+    pipe = client.pipeline(transaction=False)
+    for key in get_game_keys(game_code, player_names):
+        pipe.expire(key, GAME_TTL)
+    await pipe.execute()
+
+@timed_redis
+async def archive_game(client: Redis, game_code: str, ended_at: float):
+    """Replaces a finished game's live keys with a compact summary of its results."""
+    # Fold in whatever analytics hasn't read yet, since the answers stream is deleted below. Losing
+    # the race to a worker's AnswerAnalytics leaves entries behind, so this only stops once none are.
+    while await update_question_stats(client, game_code) != 0:
+        pass
+    game_data = await get_game_data(client, game_code)
+    players_data = await get_players_data(client, game_code)
+    summary = {
+        "code": game_code,
+        "start_time": game_data.get("start_time"),
+        "ended_at": ended_at,
+        "num_questions": await client.llen(get_questions_key(game_code)),
+        "players": sorted((
+            {
+                "name": player_name,
+                "score": player_data["score"],
+                "avg_score": get_player_avg_score(players_data, player_name),
+                "correct": len(player_data["correct_questions"]),
+                "incorrect": len(player_data["incorrect_questions"]),
+            }
+            for player_name, player_data in players_data.items()
+        ), key=lambda player: player["avg_score"], reverse=True),
+        "question_stats": await get_question_stats(client, game_code),
+    }
+    answers_logged = await client.exists(get_answers_key(game_code))
+
+    pipe = client.pipeline()
+    if GAME_SUMMARY_TTL > 0:
+        pipe.set(get_game_summary_key(game_code), encode_document(summary), ex=GAME_SUMMARY_TTL)
+        # The answer log outlives the game with its summary, so finished games can be replayed
+        if answers_logged:
+            pipe.rename(get_answers_key(game_code), get_answers_archive_key(game_code))
+            pipe.expire(get_answers_archive_key(game_code), GAME_SUMMARY_TTL)
+    pipe.delete(*get_game_keys(game_code, list(players_data)), get_host_lease_key(game_code))
+    pipe.zrem(GAMES_KEY, game_code)
+    await pipe.execute()
+    question_cache.pop(game_data.get("id", game_code), None)
+    logging.info(f"Archived game '{game_code}'")
+
+
+class GameSweeper:
+    """
+    Pushes back the TTLs of recently active games and archives ended ones. Every worker runs
+    one, but a lock taken for the length of the interval means only one sweeps at a time.
+    """
+
+    def __init__(self, client: Redis):
+        self.client = client
+        self.sweeper = None
+
+    async def start(self):
+        self.sweeper = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.sweeper:
+            self.sweeper.cancel()
+            self.sweeper = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(GAME_SWEEP_INTERVAL)
+            try:
+                if await self.client.set("games:sweeper", "1", nx=True, ex=GAME_SWEEP_INTERVAL):
+                    await self.sweep()
+            except RedisError as e:
+                logging.error(f"Error sweeping games: {e}")
+
+    async def sweep(self):
+        now = time.time()
+        games = await self.client.zrange(GAMES_KEY, 0, -1, withscores=True)
+        if not games:
+            return
+        states = await self.client.mget([f"game:{game_code}:state" for game_code, _ in games])
+
+        for (game_code, last_active), game_state in zip(games, states):
+            if game_state is None:
+                # Expired after going idle for GAME_TTL
+                await self.client.zrem(GAMES_KEY, game_code)
+            elif json.loads(game_state) == STATUS_ENDED:
+                if now - last_active >= GAME_ENDED_GRACE:
+                    await archive_game(self.client, game_code, last_active)
+            elif now - last_active <= 2 * GAME_SWEEP_INTERVAL:
+                await refresh_game_ttl(self.client, game_code)
+
+
+# Hint cache
+# game:{code}:hints holds one field per (question index, wrong answer). With SHARED_HINT_CACHE on,
+# hints are also stored under a hash of the question content so repeated quizzes reuse them.
+HINT_CACHE_TTL = int(os.getenv("HINT_CACHE_TTL", str(24 * 60 * 60)))
+SHARED_HINT_CACHE = os.getenv("SHARED_HINT_CACHE", "false").lower() == "true"
+SHARED_HINT_CACHE_TTL = int(os.getenv("SHARED_HINT_CACHE_TTL", str(7 * 24 * 60 * 60)))
+
+def get_hints_key(game_code: str):
+    return f"game:{game_code}:hints"
+
+def get_shared_hint_key(question: dict, correct_answer: str, user_answer: str):
+    content = json.dumps([question["question"], question["options"], correct_answer, user_answer], sort_keys=True)
+    return f"hint:{hashlib.sha256(content.encode('utf-8')).hexdigest()}"
+
+@timed_redis
+async def get_cached_ai_help(client: Redis, game_code: str, question_index: int, question: dict, correct_answer: str, user_answer: str):
+    hint = await client.hget(get_hints_key(game_code), f"{question_index}:{user_answer}")
+    if hint is None and SHARED_HINT_CACHE:
+        hint = await client.get(get_shared_hint_key(question, correct_answer, user_answer))
+        if hint is not None:
+            pipe = client.pipeline()
+            pipe.hsetnx(get_hints_key(game_code), f"{question_index}:{user_answer}", hint)
+            pipe.expire(get_hints_key(game_code), HINT_CACHE_TTL)
+            await pipe.execute()
+    return hint
+
+@timed_redis
+async def save_cached_ai_help(client: Redis, game_code: str, question_index: int, question: dict, correct_answer: str, user_answer: str, response: str):
+    # First writer wins, so every player sees the same hint for an option
+    pipe = client.pipeline()
+    pipe.hsetnx(get_hints_key(game_code), f"{question_index}:{user_answer}", response)
+    pipe.expire(get_hints_key(game_code), HINT_CACHE_TTL)
+    if SHARED_HINT_CACHE:
+        pipe.set(get_shared_hint_key(question, correct_answer, user_answer), response, nx=True, ex=SHARED_HINT_CACHE_TTL)
+    await pipe.execute()
+
+
+
+# Quiz library
+# Generated quizzes are cached at quiz:{id}, where the id is a hash of the normalized prompt.
+# The quizzes sorted set tracks last use so the least recently used quizzes are evicted.
+QUIZ_CACHE_SIZE = int(os.getenv("QUIZ_CACHE_SIZE", "500"))
+
+def get_quiz_key(quiz_id: str):
+    return f"quiz:{quiz_id}"
+
+def get_quiz_id(user_prompt: str):
+    normalized_prompt = " ".join(user_prompt.lower().split())
+    return hashlib.sha256(normalized_prompt.encode("utf-8")).hexdigest()[:16]
+
+@timed_redis
+async def get_cached_quiz(client: Redis, quiz_id: str):
+    quiz_data = await client.get(get_quiz_key(quiz_id))
+    if not quiz_data:
+        return {}
+    await client.zadd("quizzes", {quiz_id: time.time()}, xx=True)
+    return decode_document(quiz_data)
+
+@timed_redis
+async def save_cached_quiz(client: Redis, quiz_id: str, user_prompt: str, questions: list):
+    if QUIZ_CACHE_SIZE <= 0:
+        return
+    pipe = client.pipeline()
+    pipe.set(get_quiz_key(quiz_id), encode_document({"id": quiz_id, "prompt": user_prompt, "questions": questions}))
+    pipe.zadd("quizzes", {quiz_id: time.time()})
+    pipe.zcard("quizzes")
+    *_, num_quizzes = await pipe.execute()
+
+    if num_quizzes > QUIZ_CACHE_SIZE:
+        evicted = await client.zpopmin("quizzes", num_quizzes - QUIZ_CACHE_SIZE)
+        if evicted:
+            await client.delete(*(get_quiz_key(evicted_id) for evicted_id, _ in evicted))
+
+@timed_redis
+async def get_quiz_library(client: Redis, limit: int = 50):
+    """Most recently used quizzes, without their questions."""
+    quiz_ids = await client.zrevrange("quizzes", 0, limit - 1)
+    if not quiz_ids:
+        return []
+    quizzes = await client.mget([get_quiz_key(quiz_id) for quiz_id in quiz_ids])
+    library = []
+    for quiz_data in quizzes:
+        if quiz_data:
+            quiz = decode_document(quiz_data)
+            library.append({"id": quiz["id"], "prompt": quiz["prompt"], "num_questions": len(quiz["questions"])})
+    return library
 
 
 # Player registration and validation
-def register_player(client: Redis, game_code: str, player_name: str, questions: list):
+@timed_redis
+async def register_player(client: Redis, game_code: str, player_name: str, num_questions: int, generating: bool = False):
     player_data = {
         "id": str(uuid.uuid4()),
         "score": 0,
-        "remaining_questions": random.sample(range(len(questions)), len(questions)),
+        "remaining_questions": random.sample(range(num_questions), num_questions),
         "correct_questions": [],
         "incorrect_questions": [],
         "current_question_index": -1,
         "websocket_id": None,
         "question_start_time": None,
         "question_attempt": 0,
-        "github_avatar": get_github_avatar(player_name),
+        "github_avatar": None,
     }
-    players_data = get_players_data(client, game_code)
-    players_data[player_name] = player_data
-    save_players_data(client, game_code, players_data)
-
-
-async def validate_player(players_data: dict, player_name: str, websocket: WebSocket):
-    if not players_data or player_name not in players_data:
-        await websocket.send_text("[USER_NOT_IN_GAME]")
+    await save_player_data(client, game_code, player_name, player_data)
+
+    # Generation may have finished (and dealt to everyone already registered) while we were saving
+    if generating:
+        game_data = await get_game_data(client, game_code)
+        if not game_data.get("generating"):
+            await deal_questions(client, game_code, player_name, len(await get_game_questions(client, game_code)))
+
+
+# GitHub avatars
+# Lookups are cached at avatar:{username}, including users GitHub doesn't know (stored as null),
+# so repeat players and classrooms of made-up names don't spend the API's rate limit.
+AVATAR_CACHE_TTL = int(os.getenv("AVATAR_CACHE_TTL", str(24 * 60 * 60)))
+AVATAR_MISS_CACHE_TTL = int(os.getenv("AVATAR_MISS_CACHE_TTL", str(60 * 60)))
+
+def get_avatar_key(username: str):
+    return f"avatar:{username.lower()}"
+
+async def resolve_player_avatar(client: Redis, game_code: str, player_name: str):
+    """Looks up the player's avatar after they have joined and adds it to their data."""
+    avatar_url = await client.get(get_avatar_key(player_name))
+    if avatar_url is not None:
+        avatar_url = json.loads(avatar_url)
+    else:
+        try:
+            avatar_url = await get_github_avatar(player_name)
+        except httpx.HTTPError as e:
+            # Not cached, the next join will try again
+            logging.error(f"Error looking up GitHub avatar for '{player_name}': {e}")
+            return
+        ttl = AVATAR_CACHE_TTL if avatar_url else AVATAR_MISS_CACHE_TTL
+        await client.set(get_avatar_key(player_name), json.dumps(avatar_url), ex=ttl)
+
+    if avatar_url:
+        pipe = client.pipeline()
+        pipe.hset(get_player_key(game_code, player_name), "github_avatar", json.dumps(avatar_url))
+        _queue_player_changed(pipe, game_code, player_name)
+        await pipe.execute()
+
+
+@timed_redis
+async def deal_questions(client: Redis, game_code: str, player_name: str, num_questions: int):
+    """Gives the player a fresh random order over all of the game's questions."""
+    key = get_player_list_key(game_code, player_name, "remaining_questions")
+    pipe = client.pipeline()
+    pipe.delete(key)
+    if num_questions:
+        pipe.rpush(key, *random.sample(range(num_questions), num_questions))
+    _queue_player_changed(pipe, game_code, player_name)
+    await pipe.execute()
+
+
+async def validate_player(player_data: dict, player_name: str, websocket: WebSocket):
+    if not player_data:
+        await send_text(websocket, "[USER_NOT_IN_GAME]")
         await websocket.close()
         logging.info(f"WebSocket closed for '{player_name}': not part of game")
         return False
@@ -99,239 +1139,634 @@ async def validate_player(players_data: dict, player_name: str, websocket: WebSo
 
 
 # Load and initialize questions
-def load_questions(user_prompt: str):
+# Generated quizzes are only written to disk when QUIZ_ARCHIVE_DIR is set, keeping the newest QUIZ_ARCHIVE_MAX_FILES
+QUIZ_ARCHIVE_DIR = os.getenv("QUIZ_ARCHIVE_DIR", "")
+QUIZ_ARCHIVE_MAX_FILES = int(os.getenv("QUIZ_ARCHIVE_MAX_FILES", "1000"))
+
+async def load_questions(user_prompt: str):
+    questions_yaml = await generate_questions(user_prompt)
+    if not questions_yaml:
+        return None
     try:
-        quiz_source = generate_questions(user_prompt)
-        with open(f"{quiz_source}", "r") as file:
-            quiz_yml = safe_load(file)
-        return quiz_yml.get("questions", [])
+        return parse_questions(questions_yaml)
     except (yaml.YAMLError):
         logging.error("yaml")
         return None
-    except (FileNotFoundError):
-        logging.error("File not found")
-        return None
 
 
-def init_game_data(game_code: str, questions: list):
+async def archive_questions(quiz_id: str, questions: list):
+    if not QUIZ_ARCHIVE_DIR:
+        return
+    try:
+        await asyncio.to_thread(_write_quiz_archive, quiz_id, questions)
+    except OSError as e:
+        logging.error(f"Error archiving quiz '{quiz_id}': {e}")
+
+
+def _write_quiz_archive(quiz_id: str, questions: list):
+    os.makedirs(QUIZ_ARCHIVE_DIR, exist_ok=True)
+    with open(os.path.join(QUIZ_ARCHIVE_DIR, f"questions_{quiz_id}.yaml"), "w") as file:
+        yaml.safe_dump({"questions": questions}, file, sort_keys=False)
+
+    # Drop the oldest archives once over the limit
+    archives = sorted(
+        (entry for entry in os.scandir(QUIZ_ARCHIVE_DIR) if entry.name.startswith("questions_")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in archives[:max(len(archives) - QUIZ_ARCHIVE_MAX_FILES, 0)]:
+        os.remove(entry.path)
+
+
+async def prewarm_ai_help(client: Redis, game_code: str, questions: list):
+    """Fills the hint cache for every wrong option, a batch of questions at a time, while the lobby waits."""
+    async def prewarm_option(question_index: int, question: dict, option: str):
+        correct_answer = question["answer"]
+        if await get_cached_ai_help(client, game_code, question_index, question, correct_answer, option) is not None:
+            return
+        ai_response = await get_ai_help(question["options"][correct_answer], question["options"][option], question["question"])
+        if ai_response is not None:
+            await save_cached_ai_help(client, game_code, question_index, question, correct_answer, option, ai_response)
+
+    for batch_start in range(0, len(questions), AI_HELP_PREWARM_BATCH):
+        if await get_game_state(client, game_code) in (STATUS_ENDED, None):
+            return
+
+        await asyncio.gather(*(
+            prewarm_option(question_index, questions[question_index], option)
+            for question_index in range(batch_start, min(batch_start + AI_HELP_PREWARM_BATCH, len(questions)))
+            for option in questions[question_index]["options"]
+            if not check_answer(questions[question_index]["answer"], option)
+        ))
+    logging.info(f"Prewarmed AI help for game '{game_code}'")
+
+
+async def stream_game_questions(client: Redis, game_code: str, user_prompt: str):
+    """
+    Adds questions to a game as the model streams them, so the lobby can open before
+    generation finishes. The game can't be started until this returns. If generation fails
+    part way the game is ended and no questions are returned, so a cut-off quiz is never cached.
+    """
+    questions = []
+    failed = False
+    try:
+        async for question in stream_questions(user_prompt):
+            questions.append(question)
+            await append_game_question(client, game_code, question)
+    except Exception:
+        failed = True
+    await update_game_fields(client, game_code, generating=False)
+
+    if failed or not questions:
+        logging.error(f"Question generation failed for game '{game_code}' after {len(questions)} questions")
+        await save_game_state(client, game_code, STATUS_ENDED)
+        return []
+
+    # Players who joined during generation were only dealt the questions that existed then
+    for player_name in await get_player_names(client, game_code):
+        await deal_questions(client, game_code, player_name, len(questions))
+    logging.info(f"Generated {len(questions)} questions for game '{game_code}'")
+    return questions
+
+
+def init_game_data(game_code: str, questions: list, generating: bool = False, live: bool = False):
     return {
         "code": game_code,
+        "id": uuid.uuid4().hex,
         "questions": questions,
         "start_time": None,
+        "generating": generating,
+        "live": live,
     }
 
 
-async def manage_game_session(websocket: WebSocket, client: Redis, game_code: str, player_name: str):
-    """Manages the game session for a player by running question handling and interrupt monitoring concurrently."""
-    
-    async def handle_interrupts():
-        """Monitors game status and handles pauses or game end."""
+# Answer writes
+# Answers are written behind: each socket queues its writes on the worker's AnswerWriter and
+# waits while everything queued in the last ANSWER_FLUSH_INTERVAL seconds is committed in one
+# MULTI/EXEC pipeline, so a burst of answers shares a single round trip. Every answer is also
+# appended to the game's answers stream in the same transaction, and players are only told
+# the result once it has been committed, so an acknowledged answer is never lost.
+ANSWER_FLUSH_INTERVAL = float(os.getenv("ANSWER_FLUSH_INTERVAL", "0.005"))
+ANSWER_FLUSH_BATCH = int(os.getenv("ANSWER_FLUSH_BATCH", "500"))
+ANSWER_LOG_MAXLEN = int(os.getenv("ANSWER_LOG_MAXLEN", "100000"))
+
+def get_answers_key(game_code: str):
+    return f"game:{game_code}:answers"
+
+def _queue_answer(pipe, game_code: str, player_name: str, question_index: int, answer: str, attempt: int, correct: bool, time_taken: float, points: int):
+    entry = {
+        "player_name": player_name,
+        "question_index": question_index,
+        "answer": answer,
+        "attempt": attempt,
+        "correct": int(correct),
+        "time_taken": round(time_taken, 3),
+        "points": points,
+    }
+    pipe.xadd(get_answers_key(game_code), entry, maxlen=ANSWER_LOG_MAXLEN, approximate=True)
+
+
+class AnswerWriter:
+    """
+    Per-worker write-behind buffer for the writes made while players answer questions.
+
+    A write is a tuple of a _queue_* function and its arguments after the pipeline. Callers
+    wait on write() until their batch is committed.
+    """
+
+    def __init__(self, client: Redis):
+        self.client = client
+        self.pending = []
+        self.wakeup = asyncio.Event()
+        self.flusher = None
+
+    async def start(self):
+        self.flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.flusher:
+            self.flusher.cancel()
+            self.flusher = None
+        while self.pending:
+            await self.flush_answers()
+
+    async def write(self, *writes):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((writes, future))
+        self.wakeup.set()
+        # Without a running flusher, commit straight away
+        if self.flusher is None:
+            await self.flush_answers()
+        await future
+
+    async def _run(self):
+        while True:
+            await self.wakeup.wait()
+            # Give the rest of the burst a moment to join the batch
+            await asyncio.sleep(ANSWER_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            while self.pending:
+                await self.flush_answers()
+
+    @timed_redis
+    async def flush_answers(self):
+        batch = self.pending[:ANSWER_FLUSH_BATCH]
+        del self.pending[:ANSWER_FLUSH_BATCH]
+        ANSWER_BATCH_SIZE.observe(len(batch))
         try:
-            while True:
-                game_state = get_game_state(client, game_code)
-                if game_state == STATUS_PAUSED:
-                    await websocket.send_text("[PAUSE]")
-                    logging.info(f"Game paused for player '{player_name}'.")
-                    await wait_for_resume(game_code, websocket, client)
-                elif game_state == STATUS_ENDED:
-                    await websocket.send_text("[END]")
-                    logging.info(f"Game ended for player '{player_name}'.")
-                    break
-                await asyncio.sleep(0.5)
-        except WebSocketDisconnect:
-            logging.info(f"Player '{player_name}' disconnected during interrupts.")
-
-    async def handle_questions():
-        """Handles question-answer flow for the player."""
-        #handled_starting_condition = False
-
-        # Must be global
-        ranOutOfTime = False
-        waitingAfterQuestion = False
+            pipe = self.client.pipeline()
+            # How many commands each caller's writes queued, to match them up with the results
+            command_counts = []
+            for writes, _ in batch:
+                queued = len(pipe.command_stack)
+                for queue_write, *args in writes:
+                    queue_write(pipe, *args)
+                command_counts.append(len(pipe.command_stack) - queued)
+            results = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            logging.error(f"Failed to write a batch of {len(batch)} answers: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # EXEC doesn't roll back, so a failed command only fails the caller that queued it
+        position = 0
+        for (_, future), command_count in zip(batch, command_counts):
+            errors = [result for result in results[position:position + command_count] if isinstance(result, Exception)]
+            position += command_count
+            if future.done():
+                continue
+            if errors:
+                logging.error(f"Failed to write an answer: {errors[0]}")
+                future.set_exception(errors[0])
+            else:
+                future.set_result(None)
+
+
+# Answer analytics
+# Per-question aggregates are folded in from the answers streams in the background, so the
+# answer path never touches them. game:{code}:question_stats holds the running counts and the
+# id of the last entry folded in, and both are written in one WATCHed transaction, so every
+# entry is counted exactly once even if two workers fold the same game.
+ANALYTICS_INTERVAL = float(os.getenv("ANALYTICS_INTERVAL", "1"))
+ANALYTICS_BATCH = int(os.getenv("ANALYTICS_BATCH", "1000"))
+
+def get_question_stats_key(game_code: str):
+    return f"game:{game_code}:question_stats"
+
+def get_answers_archive_key(game_code: str):
+    return f"game_answers:{game_code}"
+
+def _fold_answer(counts: dict, totals: dict, entry: dict):
+    question_index = entry["question_index"]
+    correct = entry["correct"] == "1"
+
+    def count(field: str, amount: int = 1):
+        field = f"{question_index}:{field}"
+        counts[field] = counts.get(field, 0) + amount
+
+    count("answers")
+    count(f"option:{entry['answer']}")
+    if entry["attempt"] == "0":
+        count("first_answers")
+        if correct:
+            count("first_correct")
+    if correct:
+        count("correct")
+        count("points", int(entry["points"]))
+        # Entries logged before time_taken was recorded don't have it
+        field = f"{question_index}:time_taken"
+        totals[field] = totals.get(field, 0) + float(entry.get("time_taken", 0))
+
+@timed_redis
+async def update_question_stats(client: Redis, game_code: str):
+    """
+    Folds answers logged since the last update into the game's question stats. Returns how many,
+    0 when there were none left, or None when another worker changed the stats first.
+    """
+    stats_key = get_question_stats_key(game_code)
+    async with client.pipeline() as pipe:
+        try:
+            await pipe.watch(stats_key)
+            last_id = await pipe.hget(stats_key, "last_id") or "0-0"
+            entries = await pipe.xrange(get_answers_key(game_code), f"({last_id}", "+", count=ANALYTICS_BATCH)
+            if not entries:
+                return 0
+            counts, totals = {}, {}
+            for _, entry in entries:
+                _fold_answer(counts, totals, entry)
+
+            pipe.multi()
+            for field, amount in counts.items():
+                pipe.hincrby(stats_key, field, amount)
+            for field, amount in totals.items():
+                pipe.hincrbyfloat(stats_key, field, amount)
+            pipe.hset(stats_key, "last_id", entries[-1][0])
+            await pipe.execute()
+            return len(entries)
+        except WatchError:
+            # Another worker folded some of them first
+            return None
+
+@timed_redis
+async def get_question_stats(client: Redis, game_code: str):
+    """Per-question answer counts, difficulty (share of wrong first answers), averages and option distribution."""
+    fields = await client.hgetall(get_question_stats_key(game_code))
+    fields.pop("last_id", None)
+    raw_stats = {}
+    for field, value in fields.items():
+        question_index, _, name = field.partition(":")
+        raw_stats.setdefault(question_index, {})[name] = float(value)
+
+    question_stats = {}
+    for question_index, raw in sorted(raw_stats.items(), key=lambda item: int(item[0])):
+        correct = raw.get("correct", 0)
+        first_answers = raw.get("first_answers", 0)
+        question_stats[question_index] = {
+            "answers": int(raw.get("answers", 0)),
+            "correct": int(correct),
+            "difficulty": round(1 - raw.get("first_correct", 0) / first_answers, 3) if first_answers else None,
+            "avg_time_taken": round(raw.get("time_taken", 0) / correct, 3) if correct else None,
+            "avg_points": round(raw.get("points", 0) / correct) if correct else None,
+            "options": {name.removeprefix("option:"): int(value) for name, value in raw.items() if name.startswith("option:")},
+        }
+    return question_stats
+
+@timed_redis
+async def get_answer_log(client: Redis, game_code: str, after: str = "-", count: int = ANALYTICS_BATCH):
+    """Logged answers in the order they were committed, from the live game or its archive."""
+    key = get_answers_key(game_code)
+    if not await client.exists(key):
+        key = get_answers_archive_key(game_code)
+    start = f"({after}" if after != "-" else after
+    return [{"id": entry_id, **entry} for entry_id, entry in await client.xrange(key, start, "+", count=count)]
+
+
+class AnswerAnalytics:
+    """
+    Folds new answers of recently active games into their question stats every
+    ANALYTICS_INTERVAL seconds. Like the GameSweeper, a lock keeps it to one worker at a time.
+    """
+
+    def __init__(self, client: Redis):
+        self.client = client
+        self.consumer = None
+        # Games active since a little before the last run still have answers to fold
+        self.since = 0
+
+    async def start(self):
+        self.consumer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.consumer:
+            self.consumer.cancel()
+            self.consumer = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(ANALYTICS_INTERVAL)
+            try:
+                if await self.client.set("games:analytics", "1", nx=True, ex=max(int(ANALYTICS_INTERVAL), 1)):
+                    await self.update()
+            except Exception as e:
+                logging.error(f"Error updating answer analytics: {e}")
+
+    async def update(self):
+        started = time.time()
+        for game_code in await self.client.zrangebyscore(GAMES_KEY, self.since, "+inf"):
+            while await update_question_stats(self.client, game_code) == ANALYTICS_BATCH:
+                pass
+        self.since = started - ANALYTICS_INTERVAL
+
+
+class PlayerSession:
+    """
+    Question and answer flow for one connected player, driven by events.
+
+    A single loop reacts to socket messages, the current question's timer and game state
+    changes pushed by the GameStateWatcher. Player state is kept locally and only written
+    to Redis, through the AnswerWriter, when it changes. In a live game questions arrive as round commands from the
+    host instead of being dealt to the player one after another.
+    """
+
+    ASKING = "ASKING"
+    REVIEWING = "REVIEWING"
+
+    def __init__(self, websocket: WebSocket, client: Redis, watcher: GameStateWatcher, writer: AnswerWriter, game_code: str, player_name: str):
+        self.websocket = websocket
+        self.client = client
+        self.watcher = watcher
+        self.writer = writer
+        self.game_code = game_code
+        self.player_name = player_name
+        self.game_state = None
+        self.questions = []
+        self.player_data = {}
+        self.phase = None
+        self.question = None
+        self.timer = None
+        self.live = False
+        self.live_round_index = -1
+
+    async def run(self):
+        # Subscribe first so a command sent while the session starts up isn't missed
+        commands = self.watcher.subscribe(self.game_code)
+        try:
+            await self.play(commands)
+        finally:
+            self.watcher.unsubscribe(self.game_code, commands)
+
+    async def play(self, commands: asyncio.Queue):
+        game_data = await get_game_data(self.client, self.game_code)
+        self.questions = await get_game_questions(self.client, self.game_code)
+        self.player_data = await get_player_data(self.client, self.game_code, self.player_name)
+        if not game_data or not self.questions:
+            await send_text(self.websocket, "[GAME_NOT_FOUND]")
+            return
+        if not self.player_data:
+            await send_text(self.websocket, "[USER_NOT_IN_GAME]")
+            logging.error(f"Player '{self.player_name}' missing from game data in game '{self.game_code}'.")
+            return
+
+        self.game_state = await self.watcher.get_state(self.game_code)
+        if self.game_state == STATUS_ENDED:
+            await send_text(self.websocket, "[END]")
+            return
+        if self.game_state == STATUS_PAUSED:
+            await send_text(self.websocket, "[PAUSE]")
+
+        self.live = game_data.get("live", False)
+        if self.live:
+            await self.join_live_round(game_data.get("live_round"))
+        elif not await self.next_question():
+            return
+
+        receive_task = asyncio.create_task(self.websocket.receive_text())
+        state_task = asyncio.create_task(self.watcher.wait_for_change(self.game_code, self.game_state))
+        command_task = asyncio.create_task(commands.get())
         try:
             while True:
-                game_data = get_game_data(client, game_code)
-                players_data = get_players_data(client, game_code)
-                if not game_data: 
-                    await websocket.send_text("[GAME_NOT_FOUND]")
-                elif player_name not in players_data:
-                    # Retry
-                    if player_name not in players_data:
-                        await websocket.send_text("[USER_NOT_IN_GAME]")
-                        logging.error(f"Player '{player_name}' missing from game data in game '{game_code}'.")
-                        break
-
-                # Try to clear any incoming input before the game starts
-                try:
-                    while True: #and not handled_starting_condition:
-                         await asyncio.wait_for(websocket.receive_text(), timeout=0.1)
-
-                # Ran out of input (ideal)
-                except asyncio.TimeoutError:
-                    #handled_starting_condition = True
-                    pass 
-
-                # Loop through until receives any input to pause functionality
-                if ranOutOfTime:
-                    response = {"out_of_time": {"answer": f"{correctAnswer}. {question["options"][correctAnswer]}"}}
-                    await websocket.send_text(json.dumps(response))
-                    await websocket.receive_text()
-                    waitingAfterQuestion = False
-                    ranOutOfTime = False
-                elif waitingAfterQuestion:
-                    # Wait for user for next question
-                    await websocket.receive_text()
-
-                    
-                
-                questions_remaining = players_data[player_name]["remaining_questions"]
-                if len(questions_remaining) == 0 and players_data[player_name]["current_question_index"] == -1:
-                    await websocket.send_text("[ALL_QUESTIONS_ANSWERED]")
-                    break
-
-
-                if (players_data[player_name]["question_start_time"] is not None and players_data[player_name]["question_start_time"] + 30 - time.time() <= 0):
-                    players_data[player_name]["incorrect_questions"].append(players_data[player_name]["current_question_index"])
-                    players_data[player_name]["current_question_index"] = -1
-                    players_data[player_name]["question_attempt"] = 0
-                    players_data[player_name]["question_start_time"] = None
-                    save_players_data(client, game_code, players_data)
-
-                if players_data[player_name]["current_question_index"] == -1:
-                    question_index = questions_remaining.pop()
-                    question = await get_random_question(game_data, question_index)
-                    players_data[player_name]["remaining_questions"] = questions_remaining
-                    players_data[player_name]["question_start_time"] = time.time()
-                    players_data[player_name]["current_question_index"] = question_index
-                    save_players_data(client, game_code, players_data)
-                
-                else:
-                    question_index = players_data[player_name]["current_question_index"]
-                    question = game_data["questions"][question_index]
-
-                correctAnswer = question.get("answer", "")
-                # Don't send correct answer to player
-                del question["answer"]
-
-                question['start_time'] = players_data[player_name]["question_start_time"]
-                question['questions_remaining'] = len(players_data[player_name]["remaining_questions"])
-                question['total_questions'] = len(game_data["questions"])
-                response = {"question": question}
-                await websocket.send_text(json.dumps(response))
-                logging.info(f"Sent question to player '{player_name}': {question}")
-
-                try:
-                    points = 1000
-                    wrong_multiplier = 0.65
-                    time_multiplier = 0.75
-                    saved_attempts = players_data[player_name]["question_attempt"]
-
-                    for attempt in range(saved_attempts, NUM_ATTEMPTS):
-                        # Create loop waiting for input, in paused state nothing happens
-                        # If user sends an input after pause ends, we grab game_data so it can be processed on resume
-                        while True:
-                            user_answer = ""
-                            try:
-                                user_answer = await asyncio.wait_for(websocket.receive_text(), timeout=players_data[player_name]["question_start_time"] + 30 - time.time())
-                            except asyncio.TimeoutError:
-                                if players_data[player_name]["question_start_time"] + 30 - time.time() <= 0:
-                                    players_data[player_name]["incorrect_questions"].append(question_index)
-                                    players_data[player_name]["current_question_index"] = -1
-                                    players_data[player_name]["question_attempt"] = 0
-                                    players_data[player_name]["question_start_time"] = None
-                                    save_players_data(client, game_code, players_data)
-                                    ranOutOfTime = True
-                                    break
-
-                            # Check if answer is valid
-                            user_answer = validate_answer(user_answer, question["options"])
-                            if user_answer is None:
-                                response = {"attempt": {"valid": False, "final": False, "correct": False, "points": 0}}
-                                await websocket.send_text(json.dumps(response))
-                                continue
-                            game_state = get_game_state(client, game_code)
-                            if game_state != STATUS_STARTED:
-                                continue
-                            else:
-                                break
-
-                        if ranOutOfTime:
-                            points = 0
-                            break
-                        # First answer
-                        if check_answer(correctAnswer, user_answer):
-                            points = get_score(points, attempt, wrong_multiplier, time_multiplier, players_data[player_name]["question_start_time"])
-                            response = {"attempt": {"valid": True, "final": True, "correct": True, "points": points}}
-                            await websocket.send_text(json.dumps(response))
-                            players_data = get_players_data(client, game_code)
-                            players_data[player_name]["correct_questions"].append(question_index)
-                            save_players_data(client, game_code, players_data)
-                            waitingAfterQuestion = True
-                            break
-                        else:
-                            if attempt == 0:
-                                response = {"attempt": {"valid": True, "final": False, "correct": False}}
-                                await websocket.send_text(json.dumps(response))
-                                players_data = get_players_data(client, game_code)
-                                players_data[player_name]["question_attempt"] += 1
-                            elif attempt == 1:
-                                points = 0
-                                response = {"attempt": {"final": True, "correct": False, "points": points, "answer": correctAnswer}}
-                                await websocket.send_text(json.dumps(response))
-                                players_data[player_name]["incorrect_questions"].append(question_index)
-                                save_players_data(client, game_code, players_data)
-                                waitingAfterQuestion = True
-                                break
-
-                        # Get help from AI:
-                        cached_help = get_ai_response_cache(client, game_code)
-                        if str(question_index) in cached_help and user_answer in cached_help[str(question_index)]:
-                            ai_response = cached_help[str(question_index)][user_answer]
-                        else:
-                            ai_response = get_ai_help(question["options"][correctAnswer], question["options"][user_answer], question["question"])
-                            save_ai_response_cache(client, game_code, user_answer, question_index, ai_response)
-                        response = {"help": ai_response}
-                        await websocket.send_text(json.dumps(response))
-
-                    players_data = get_players_data(client, game_code)
-                    players_data[player_name]["score"] += points
-                    players_data[player_name]["current_question_index"] = -1
-                    players_data[player_name]["question_attempt"] = 0
-                    players_data[player_name]["question_start_time"] = None
-                    save_players_data(client, game_code, players_data)
-                    waitingAfterQuestion = True
-
-                    # Send score metrics to player
-                    relative_leaderboard = get_relative_leaderboard(players_data, player_name)
-                    response = {"leaderboard": relative_leaderboard}
-                    await websocket.send_text(json.dumps(response))
-
-                except WebSocketDisconnect:
-                    logging.info(f"Player '{player_name}' disconnected while answering questions.")
-                    break
-        except WebSocketDisconnect:
-            logging.info(f"Player '{player_name}' disconnected.")
-
-    # Create tasks for interrupts and questions
-    interrupt_task = asyncio.create_task(handle_interrupts())
-    question_task = asyncio.create_task(handle_questions())
-
+                waiting = {receive_task, state_task, command_task}
+                if self.phase == self.ASKING:
+                    waiting.add(self.timer.future)
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+                if state_task in done:
+                    if not await self.handle_state(state_task.result()):
+                        return
+                    state_task = asyncio.create_task(self.watcher.wait_for_change(self.game_code, self.game_state))
+
+                if command_task in done:
+                    if not await self.handle_command(command_task.result()):
+                        return
+                    command_task = asyncio.create_task(commands.get())
+
+                # A deadline that passed in the same wakeup as an answer wins over it
+                if self.phase == self.ASKING and self.timer.future in done:
+                    await self.time_out()
+
+                if receive_task in done:
+                    message = receive_task.result()
+                    receive_task = asyncio.create_task(self.websocket.receive_text())
+                    if not await self.handle_message(message):
+                        return
+        finally:
+            receive_task.cancel()
+            state_task.cancel()
+            command_task.cancel()
+            if self.timer:
+                self.watcher.timers.cancel(self.timer)
+
+    async def time_out(self):
+        await self.finish_question(False)
+        response = {"out_of_time": {"answer": f"{self.question['answer']}. {self.question['options'][self.question['answer']]}"}}
+        await send_text(self.websocket, json.dumps(response))
+
+    def elapsed(self):
+        """Seconds of game time since the current question was asked."""
+        return QUESTION_TIME_LIMIT - self.watcher.timers.remaining(self.timer)
+
+    async def handle_state(self, game_state: str):
+        self.game_state = game_state
+        if game_state == STATUS_PAUSED:
+            await send_text(self.websocket, "[PAUSE]")
+            logging.info(f"Game paused for player '{self.player_name}'.")
+        elif game_state == STATUS_STARTED:
+            await send_text(self.websocket, "[RESUME]")
+            # The deadline moved by however long the pause was, so move the player's countdown too
+            if self.phase == self.ASKING:
+                response = {"timer": {"start_time": time.time() - self.elapsed()}}
+                await send_text(self.websocket, json.dumps(response))
+        elif game_state == STATUS_ENDED:
+            await send_text(self.websocket, "[END]")
+            logging.info(f"Game ended for player '{self.player_name}'.")
+            return False
+        return True
+
+    async def handle_command(self, command: dict):
+        # Rounds already asked, e.g. read from the game before their command arrived, are skipped
+        if command["command"] == "round" and self.live and command["question_index"] > self.live_round_index:
+            # Whatever is left of the previous round runs out when the host moves on
+            if self.phase == self.ASKING:
+                await self.time_out()
+            await self.ask_round(command["question_index"], command["start_time"], command["frame"])
+        return True
+
+    async def handle_message(self, message: str):
+        # Any message after a question has been answered moves on to the next one
+        if self.phase == self.REVIEWING and not self.live:
+            return await self.next_question()
+        # Live players wait for the host to start the next round
+        if self.phase != self.ASKING:
+            return True
+
+        user_answer = validate_answer(message, self.question["options"])
+        if user_answer is None:
+            response = {"attempt": {"valid": False, "final": False, "correct": False, "points": 0}}
+            await send_text(self.websocket, json.dumps(response))
+            return True
+        # Answers sent while the game is paused are dropped
+        if self.game_state != STATUS_STARTED:
+            return True
+
+        attempt = self.player_data["question_attempt"]
+        correct_answer = self.question["answer"]
+        if check_answer(correct_answer, user_answer):
+            points = get_score(1000, attempt, 0.65, 0.75, time.time() - self.elapsed())
+            response = {"attempt": {"valid": True, "final": True, "correct": True, "points": points}}
+            await self.finish_question(True, points, user_answer, response)
+        elif attempt + 1 < NUM_ATTEMPTS:
+            await self.writer.write(
+                *self.get_answer_writes(user_answer, False, 0),
+                # Live rounds aren't written when they start, so the attempt is stored with its question
+                (_queue_player_fields, self.game_code, self.player_name,
+                 {"current_question_index": self.player_data["current_question_index"], "question_attempt": attempt + 1}),
+            )
+            self.player_data["question_attempt"] = attempt + 1
+            response = {"attempt": {"valid": True, "final": False, "correct": False}}
+            await send_text(self.websocket, json.dumps(response))
+            await self.send_help(user_answer)
+        else:
+            response = {"attempt": {"final": True, "correct": False, "points": 0, "answer": correct_answer}}
+            await self.finish_question(False, 0, user_answer, response)
+        return True
+
+    def get_answer_writes(self, answer: str, correct: bool, points: int):
+        question_index = self.player_data["current_question_index"]
+        attempt = self.player_data["question_attempt"]
+        writes = [(_queue_answer, self.game_code, self.player_name, question_index, answer, attempt, correct, self.elapsed(), points)]
+        if self.live and attempt == 0:
+            writes.append((_queue_option_count, self.game_code, question_index, answer))
+        return writes
+
+    async def send_help(self, user_answer: str):
+        question_index = self.player_data["current_question_index"]
+        correct_answer = self.question["answer"]
+        ai_response = await get_cached_ai_help(self.client, self.game_code, question_index, self.question, correct_answer, user_answer)
+        HINT_CACHE_REQUESTS.labels("miss" if ai_response is None else "hit").inc()
+        if ai_response is None:
+            ai_response = await get_ai_help(self.question["options"][correct_answer], self.question["options"][user_answer], self.question["question"])
+            if ai_response is None:
+                ai_response = AI_HELP_FALLBACK
+            else:
+                await save_cached_ai_help(self.client, self.game_code, question_index, self.question, correct_answer, user_answer, ai_response)
+        response = {"help": ai_response}
+        await send_text(self.websocket, json.dumps(response))
+
+    async def finish_question(self, correct: bool, points: int = 0, answer: str = None, response: dict = None):
+        """Records the result of the current question, then sends the response and the player's standing."""
+        await self.record_result(correct, points, answer)
+        self.watcher.timers.cancel(self.timer)
+        self.timer = None
+        self.phase = self.REVIEWING
+        if response:
+            await send_text(self.websocket, json.dumps(response))
+
+        # Send score metrics to player
+        relative_leaderboard = await get_relative_leaderboard(self.client, self.game_code, self.player_name)
+        response = {"leaderboard": relative_leaderboard}
+        await send_text(self.websocket, json.dumps(response))
+
+    async def record_result(self, correct: bool, points: int = 0, answer: str = None):
+        question_index = self.player_data["current_question_index"]
+        writes = self.get_answer_writes(answer, correct, points) if answer is not None else []
+        await self.writer.write(*writes, (_queue_finish_question, self.game_code, self.player_name, question_index, correct, points))
+        self.player_data["correct_questions" if correct else "incorrect_questions"].append(question_index)
+        if question_index in self.player_data["remaining_questions"]:
+            self.player_data["remaining_questions"].remove(question_index)
+        self.player_data["score"] += points
+        self.player_data["current_question_index"] = -1
+        self.player_data["question_attempt"] = 0
+        self.player_data["question_start_time"] = None
+
+    async def next_question(self):
+        """Sends the player's current question, or deals the next one. Returns False once none are left."""
+        # Question start times are in game time, which doesn't move while the game is paused.
+        # A question that ran out while the player was disconnected counts as incorrect.
+        game_time = await self.watcher.get_game_time(self.game_code)
+        start_time = self.player_data["question_start_time"]
+        if self.player_data["current_question_index"] != -1 and start_time is not None and start_time + QUESTION_TIME_LIMIT - game_time <= 0:
+            await self.record_result(False)
+
+        if self.player_data["current_question_index"] == -1:
+            if not self.player_data["remaining_questions"]:
+                await send_text(self.websocket, "[ALL_QUESTIONS_ANSWERED]")
+                return False
+            question_index = self.player_data["remaining_questions"][-1]
+            await self.writer.write((_queue_next_question, self.game_code, self.player_name, question_index, game_time))
+            self.player_data["remaining_questions"].pop()
+            self.player_data["current_question_index"] = question_index
+            self.player_data["question_start_time"] = game_time
+            self.player_data["question_attempt"] = 0
+
+        await self.ask_question(game_time, len(self.player_data["remaining_questions"]))
+        return True
+
+    async def join_live_round(self, live_round: dict):
+        """Asks the live game's current question, unless the player has already answered it."""
+        if not live_round:
+            return
+        question_index = live_round["question_index"]
+        self.live_round_index = question_index
+        if question_index in self.player_data["correct_questions"] or question_index in self.player_data["incorrect_questions"]:
+            return
+        await self.ask_round(question_index, live_round["start_time"])
+
+    async def ask_round(self, question_index: int, start_time: float, frame: str = None):
+        if question_index >= len(self.questions):
+            self.questions = await get_game_questions(self.client, self.game_code)
+        self.live_round_index = question_index
+        # A player rejoining the round they were answering keeps the attempts they already used
+        if self.player_data["current_question_index"] != question_index:
+            self.player_data["question_attempt"] = 0
+        self.player_data["current_question_index"] = question_index
+        self.player_data["question_start_time"] = start_time
+        game_time = await self.watcher.get_game_time(self.game_code)
+        await self.ask_question(game_time, len(self.questions) - question_index - 1, frame)
+
+    async def ask_question(self, game_time: float, questions_remaining: int, frame: str = None):
+        """Starts the timer on the player's current question and sends it, as the given frame if there is one."""
+        self.question = await get_random_question(self.questions, self.player_data["current_question_index"])
+        self.phase = self.ASKING
+        elapsed = game_time - self.player_data["question_start_time"]
+        self.timer = self.watcher.schedule_timer(self.game_code, QUESTION_TIME_LIMIT - elapsed, self.game_state)
+
+        # Players count down on their own clock, so send when the question started on it
+        if frame is None:
+            frame = encode_question_frame(self.question, time.time() - elapsed, questions_remaining, len(self.questions))
+        await send_text(self.websocket, frame)
+        log_payload(f"Sent question to player '{self.player_name}'", frame)
+
+
+async def manage_game_session(websocket: WebSocket, client: Redis, watcher: GameStateWatcher, writer: AnswerWriter, game_code: str, player_name: str):
+    """Manages the game session for a player until the game ends, they run out of questions or disconnect."""
     try:
-        # Wait for the first task to complete (e.g., game ends, player disconnects)
-        done, pending = await asyncio.wait(
-            [interrupt_task, question_task],
-            return_when=asyncio.FIRST_COMPLETED
-        )
+        await PlayerSession(websocket, client, watcher, writer, game_code, player_name).run()
+    except WebSocketDisconnect:
+        logging.info(f"Player '{player_name}' disconnected.")
     finally:
-        # Cancel any pending tasks
-        for task in pending:
-            task.cancel()
-
-        # Cleanup WebSocket and Redis mappings
-        #players_data = get_players_data(client, game_code)
-        #if player_name in players_data:
-        #    del id_to_websocket[players_data[player_name]["id"]]
-        await websocket.close()
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close()
         logging.info(f"WebSocket connection closed for player '{player_name}' in game '{game_code}'")
 
 
@@ -359,50 +1794,52 @@ def get_player_avg_score(players_data: dict, player_name: str):
     player_avg_score = player_score / (len(players_data[player_name]["correct_questions"]) + len(players_data[player_name]["incorrect_questions"]))
     return player_avg_score
 
-def get_relative_leaderboard(players_data: dict, player_name: str):
+# The player's score and place and their closest neighbours on the leaderboard, with avatars, in
+# one round trip. The neighbours' hashes are found from the player key prefix in ARGV[2].
+RELATIVE_LEADERBOARD_SCRIPT = register_script("""
+local score = redis.call('HGET', KEYS[2], 'score')
+local avg_score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+local bound = '(' .. (avg_score or '0')
+local result = {score, avg_score, redis.call('ZCOUNT', KEYS[1], bound, '+inf')}
+local ahead = redis.call('ZRANGEBYSCORE', KEYS[1], bound, '+inf', 'WITHSCORES', 'LIMIT', 0, 1)
+local behind = redis.call('ZREVRANGEBYSCORE', KEYS[1], bound, '-inf', 'WITHSCORES', 'LIMIT', 0, 1)
+for _, neighbour in ipairs({ahead, behind}) do
+    if neighbour[1] then
+        local avatar = redis.call('HGET', ARGV[2] .. neighbour[1], 'github_avatar')
+        table.insert(result, neighbour[1])
+        table.insert(result, neighbour[2])
+        table.insert(result, avatar)
+    else
+        table.insert(result, false)
+        table.insert(result, false)
+        table.insert(result, false)
+    end
+end
+return result
+""")
+
+@timed_redis
+async def get_relative_leaderboard(client: Redis, game_code: str, player_name: str):
     # Get most closely ahead of player and behind of player based on their score average
-    player_score = players_data[player_name]["score"]
-    player_avg_score = get_player_avg_score(players_data, player_name)
+    player_score, player_avg_score, num_ahead, *neighbours = await RELATIVE_LEADERBOARD_SCRIPT(
+        keys=[get_leaderboard_key(game_code), get_player_key(game_code, player_name)],
+        args=[player_name, get_player_key(game_code, "")],
+        client=client,
+    )
     relative_leaderboard = {
         "ahead": None,
         "behind": None,
-        "place": 0,
-        "score": player_score,
-        "avg_score": player_avg_score,
+        "place": num_ahead + 1,
+        "score": int(player_score or 0),
+        "avg_score": float(player_avg_score) if player_avg_score else 0,
     }
-
-    # Iterate over other players to find the closest ahead and behind
-    for other_player, other_data in players_data.items():
-        if other_player != player_name:
-            other_player_avg_score = get_player_avg_score(players_data, other_player)
-            # Check for the player ahead
-            if other_player_avg_score > player_avg_score:
-                if (
-                    relative_leaderboard["ahead"] is None or
-                    other_player_avg_score < relative_leaderboard["ahead"]["avg_score"]
-                ):
-                    relative_leaderboard["ahead"] = {
-                        "player_name": other_player,
-                        "avg_score": other_player_avg_score,
-                        "github_avatar": other_data.get("github_avatar"),
-                    }
-            # Check for the player behind
-            elif other_player_avg_score < player_avg_score:
-                if (
-                    relative_leaderboard["behind"] is None or
-                    other_player_avg_score > relative_leaderboard["behind"]["avg_score"]
-                ):
-                    relative_leaderboard["behind"] = {
-                        "player_name": other_player,
-                        "avg_score": other_player_avg_score,
-                        "github_avatar": other_data.get("github_avatar"),
-                    }
-    
-    # Calculate player's place in the leaderboard
-    relative_leaderboard["place"] = (
-        len([p for p in players_data if get_player_avg_score(players_data, p) > player_avg_score]) + 1
-    )
-    
+    for position, (other_player, other_player_avg_score, avatar) in zip(("ahead", "behind"), (neighbours[:3], neighbours[3:])):
+        if other_player is not None:
+            relative_leaderboard[position] = {
+                "player_name": other_player,
+                "avg_score": float(other_player_avg_score),
+                "github_avatar": json.loads(avatar) if avatar else None,
+            }
     return relative_leaderboard
 
 def get_players_metrics(players_data: dict):
@@ -431,22 +1868,14 @@ def validate_answer(answer, question_options):
     if answer.lower() in [k.lower() for k in question_options.keys()]:
         return answer.upper() if upperCase else answer.lower()
 
-async def get_random_question(game_data, question_index):
-    return game_data["questions"][question_index]
+async def get_random_question(questions, question_index):
+    return questions[question_index]
 
 
 def check_answer(answerCorrect, answerUser):
     return answerCorrect.lower() == answerUser.lower()
 
 
-async def wait_for_resume(game_code, websocket, client):
-    game_state = get_game_state(client, game_code)
-    while game_state == STATUS_PAUSED:
-        await asyncio.sleep(0.5)
-        game_state = get_game_state(client, game_code)
-    await websocket.send_text("[RESUME]")
-
-
 def generate_game_code():
     return str(uuid.uuid4())[:5].upper()
 
@@ -456,111 +1885,123 @@ def generate_game_code():
 #async def broadcast(id_to_websocket: dict, client: Redis, game_code: str, message: str):
 #    game_data = get_game_data(client, game_code)
 #    for player_id, websocket in id_to_websocket.items():
-#        await websocket.send_text(message)
+#        await send_text(websocket, message)
+
+async def manage_host_session(websocket: WebSocket, client: Redis, watcher: GameStateWatcher, game_code: str, websocket_id: str):
+    game_data = await get_game_data(client, game_code)
+    live = game_data.get("live", False)
 
-async def manage_host_session(websocket: WebSocket, client: Redis, game_code: str):
     async def handle_host_commands():
-        game_state = get_game_state(client, game_code)
+        live_round = game_data.get("live_round")
+        game_state = await get_game_state(client, game_code)
 
-        #await websocket.send_text(str(game_state) + str(STATUS_WAITING))
+        #await send_text(websocket, str(game_state) + str(STATUS_WAITING))
 
         if game_state == STATUS_WAITING:
-            await websocket.send_text("[WAITING]")
+            await send_text(websocket, "[WAITING]")
 
         try:
             while True:
                 command = (await websocket.receive_text()).lower()
-                game_state = get_game_state(client, game_code)
-
-                #await websocket.send_text(str(game_state) + str(command))
-
-                if command == "start" and game_state == STATUS_WAITING:
-                    # Essential: Must get the gate state before trying to change game values, as it will update current game data with outdated data
-                    game_state = STATUS_STARTED
-                    game_data = get_game_data(client, game_code)
-                    game_data["start_time"] = time.time()
-                    save_game_data(client, game_code, game_data)
-                    save_game_state(client, game_code, game_state)
-                    await websocket.send_text("[START]")
-
-                elif command == "pause" and game_state == STATUS_STARTED:
-                    game_state = STATUS_PAUSED
-                    save_game_state(client, game_code, game_state)
-                    await websocket.send_text("[PAUSE]")
-
-                elif command == "resume" and game_state == STATUS_PAUSED:
-                    game_state = STATUS_STARTED
-                    save_game_state(client, game_code, game_state)
-                    await websocket.send_text("[RESUME]")
-
-                elif command == "end":
-                    game_state = STATUS_ENDED
-                    save_game_state(client, game_code, game_state)
-                    await websocket.send_text("[END]")
-                    break
+
+                if command in GAME_TRANSITIONS:
+                    result = await transition_game_state(client, game_code, command)
+                    if result == TRANSITION_GENERATING:
+                        await send_text(websocket, "[QUIZ_GENERATING]")
+                    elif result == TRANSITION_REJECTED:
+                        await send_text(websocket, "[INVALID_COMMAND]")
+                    else:
+                        await send_text(websocket, f"[{command.upper()}]")
+                        if command == "end":
+                            break
+
+                # Live games move on to the next question only when the host says so
+                elif command == "next" and live and await get_game_state(client, game_code) == STATUS_STARTED:
+                    questions = await get_game_questions(client, game_code)
+                    question_index = live_round["question_index"] + 1 if live_round else 0
+                    if question_index < len(questions):
+                        game_time = await watcher.get_game_time(game_code)
+                        live_round = await start_live_round(client, game_code, question_index, questions, game_time)
+                        await send_text(websocket, "[NEXT]")
+                    elif (await get_game_data(client, game_code)).get("generating"):
+                        await send_text(websocket, "[QUIZ_GENERATING]")
+                    else:
+                        await send_text(websocket, "[ALL_QUESTIONS_ANSWERED]")
 
                 else:
-                    await websocket.send_text(["[INVALID_COMMAND]"])
+                    await send_text(websocket, "[INVALID_COMMAND]")
 
         except WebSocketDisconnect:
             logging.info("Host disconnected")
 
-        await websocket.close()
         logging.info("Host WebSocket connection closed.")
 
+    async def keep_host_lease():
+        while True:
+            await asyncio.sleep(HOST_LEASE_TTL / 3)
+            if not await renew_host_lease(client, game_code, websocket_id):
+                logging.error(f"Host lost its lease on game '{game_code}'")
+                await send_text(websocket, "[HOST_ALREADY_CONNECTED]")
+                return
+
     async def retrieve_game_metrics():
-        # Send metrics when host joins if they reconnect
-        player_metrics = get_players_metrics(get_players_data(client, game_code))
-        response = {"metrics": player_metrics}
-        await websocket.send_text(json.dumps(response))
+        # Send a full snapshot when the host joins (or reconnects), then only what changed
+        version = await get_metrics_version(client, game_code)
+        game_state = await watcher.get_state(game_code)
+        game_metrics = {
+            "version": version,
+            "game_data": await get_game_data(client, game_code),
+            "player_metrics": get_players_metrics(await get_players_data(client, game_code)),
+        }
+        if live:
+            option_counts = game_metrics["option_counts"] = await get_option_counts(client, game_code)
+        response = {"metrics": game_metrics}
+        await send_text(websocket, json.dumps(response))
 
         try:
-            num_players = len(get_players_data(client, game_code))
             while True:
-                game_state = get_game_state(client, game_code)
-                players_data = get_players_data(client, game_code)
-
-                num_players_current = len(players_data)
-                
-                if game_state == STATUS_STARTED or num_players_current != num_players:
-                    game_data = get_game_data(client, game_code)
-                    # Remove questions from game data to avoid bloating the socket message
-                    game_data.pop("questions", None)
-                    players_data = get_players_data(client, game_code)
-                    player_metrics = get_players_metrics(players_data)
-                    game_metrics = {
-                        "game_data": game_data,
-                        "player_metrics": player_metrics,
-                    }
-                    response = {"metrics": game_metrics}
-                    await websocket.send_text(json.dumps(response))
-
-                # Update player count if it has changed
-                if num_players_current != num_players:
-                    num_players = num_players_current
-
                 await asyncio.sleep(1)
+
+                game_metrics = {}
+                changed_players, latest_version = await get_changed_players(client, game_code, version)
+                if changed_players:
+                    players_data = await get_players_data(client, game_code, changed_players)
+                    game_metrics["player_metrics"] = get_players_metrics(players_data)
+                    version = latest_version
+
+                current_state = await watcher.get_state(game_code)
+                if current_state != game_state:
+                    game_state = current_state
+                    game_metrics["game_data"] = await get_game_data(client, game_code)
+
+                if live:
+                    current_counts = await get_option_counts(client, game_code)
+                    if current_counts != option_counts:
+                        option_counts = game_metrics["option_counts"] = current_counts
+
+                if game_metrics:
+                    game_metrics["version"] = version
+                    response = {"metrics_delta": game_metrics}
+                    await send_text(websocket, json.dumps(response))
         except WebSocketDisconnect:
             logging.info("Host disconnected")
 
-    command_task = asyncio.create_task(handle_host_commands())
-    metrics_task = asyncio.create_task(retrieve_game_metrics())
-
-
+    tasks = [
+        asyncio.create_task(handle_host_commands()),
+        asyncio.create_task(retrieve_game_metrics()),
+        asyncio.create_task(keep_host_lease()),
+    ]
 
     try:
-        # Wait for the first task to complete (e.g., game ends, player disconnects)
-        done, pending = await asyncio.wait(
-            [command_task, metrics_task],
-            return_when=asyncio.FIRST_COMPLETED
-        )
+        # Wait for the first task to complete (e.g., game ends, host disconnects, lease lost)
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
     finally:
-        # Cancel any pending tasks
-        for task in pending:
+        for task in tasks:
             task.cancel()
 
-        await websocket.close()
-        logging.info(f"WebSocket connection closed for player '{player_name}' in game '{game_code}'")
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close()
+        logging.info(f"Host WebSocket connection closed for game '{game_code}'")
 
 
 
@@ -569,22 +2010,17 @@ async def manage_host_session(websocket: WebSocket, client: Redis, game_code: st
 #    """Utility function to update game data in Redis and send a message to the host."""
 #    client = Redis("redis", port=6379, db=0)
 #    client.set(f"game:{game_code}", json.dumps(game_data))
-#    await websocket.send_text(message)
+#    await send_text(websocket, message)
 #    logging.info(message)
 
-async def wait_for_game_start(websocket: WebSocket, game_code: str):
-    """Continuously checks if the game status is 'started' and notifies the player."""
-    client = Redis("redis", port=6379, db=0)
-
+async def wait_for_game_start(websocket: WebSocket, watcher: GameStateWatcher, game_code: str):
+    """Waits for the game status to leave 'waiting' and notifies the player."""
     # Send initial message
-    game_state = get_game_state(client, game_code)
+    game_state = await watcher.get_state(game_code)
     if game_state == STATUS_WAITING:
-        await websocket.send_text("[WAITING]")
+        await send_text(websocket, "[WAITING]")
 
-    while True:
-        game_state = get_game_state(client, game_code)
-        if game_state and game_state == STATUS_STARTED:
-                await websocket.send_text("[START]")
-                logging.info(f"Player notified of game start for game '{game_code}'")
-                break
-        await asyncio.sleep(0.5)
\ No newline at end of file
+    game_state = await watcher.wait_for_state(game_code, (STATUS_STARTED, STATUS_PAUSED, STATUS_ENDED))
+    if game_state == STATUS_STARTED:
+        await send_text(websocket, "[START]")
+        logging.info(f"Player notified of game start for game '{game_code}'")
\ No newline at end of file
@@ -0,0 +1,278 @@
+"""
+Load generator for a running Quizly backend.
+
+Start the stub LLM and GitHub servers, then point the backend at them:
+
+    python load_test.py stubs --port 9000 --llm-latency 0.5
+    GROQ_BASE_URL=http://localhost:9000 GITHUB_API_URL=http://localhost:9000 uvicorn app:app --workers 4
+
+Then create a game, join simulated players and play it through start, pause, resume and end:
+
+    python load_test.py run --url http://localhost:8000 --players 200 --redis-url redis://localhost:6379/0
+
+The stub quiz always has "A" as the answer, which is how --accuracy controls how often players get it right.
+LLM_PROVIDER=fake also works without the LLM stub, but its answers vary so --accuracy no longer applies.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import httpx
+import redis.asyncio as redis
+import uvicorn
+import websockets
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+# Stub servers
+def get_stub_quiz(num_questions: int):
+    lines = ["questions:"]
+    for i in range(num_questions):
+        lines += [
+            f"  - question: \"Load test question {i + 1}?\"",
+            "    options:",
+            "      A: \"Right\"",
+            "      B: \"Wrong\"",
+            "      C: \"Also wrong\"",
+            "      D: \"Still wrong\"",
+            "    answer: \"A\"",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def create_stub_app(llm_latency: float, num_questions: int):
+    stub_app = FastAPI()
+    quiz = get_stub_quiz(num_questions)
+
+    # Same path the Groq SDK posts to, so GROQ_BASE_URL can point here
+    @stub_app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(llm_latency)
+        prompt = body["messages"][-1]["content"]
+        content = quiz if prompt.startswith("Generate") else "Think about which option actually answers the question."
+        completion_id = f"chatcmpl-{uuid.uuid4()}"
+
+        if body.get("stream"):
+            async def stream_chunks():
+                for line in content.splitlines(keepends=True):
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body["model"],
+                        "choices": [{"index": 0, "delta": {"content": line}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(stream_chunks(), media_type="text/event-stream")
+
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    @stub_app.get("/users/{username}")
+    async def github_user(username: str):
+        return {"login": username, "avatar_url": f"https://avatars.example.com/{username}"}
+
+    return stub_app
+
+
+def run_stubs(args):
+    uvicorn.run(create_stub_app(args.llm_latency, args.questions), host=args.host, port=args.port, log_level="warning")
+
+
+# Simulated game
+class Stats:
+    def __init__(self):
+        self.ack_latencies = []
+        self.messages = 0
+        self.answers = 0
+        self.players_done = 0
+
+
+async def play(args, ws_url: str, game_code: str, player_name: str, stats: Stats, started: asyncio.Event):
+    async with websockets.connect(f"{ws_url}/ws/game/{game_code}/{player_name}", max_size=None) as websocket:
+        paused = False
+        question = None
+        tried = set()
+        sent_at = None
+        pending = None
+
+        async def answer_later():
+            nonlocal sent_at
+            await asyncio.sleep(random.uniform(0, 2 * args.think_time))
+            # Answers sent while paused are dropped by the server, so wait for the resume
+            while paused:
+                await asyncio.sleep(0.05)
+            remaining = [option for option in question["options"] if option not in tried]
+            if "A" in remaining and random.random() < args.accuracy:
+                answer = "A"
+            else:
+                answer = random.choice([option for option in remaining if option != "A"] or remaining)
+            tried.add(answer)
+            sent_at = time.perf_counter()
+            stats.messages += 1
+            await websocket.send(answer)
+
+        started.set()
+        try:
+            async for message in websocket:
+                stats.messages += 1
+                if message in ("[END]", "[ALL_QUESTIONS_ANSWERED]"):
+                    break
+                elif message == "[PAUSE]":
+                    paused = True
+                elif message == "[RESUME]":
+                    paused = False
+                if message.startswith("["):
+                    continue
+
+                data = json.loads(message)
+                if "question" in data:
+                    question = data["question"]
+                    tried = set()
+                    pending = asyncio.create_task(answer_later())
+                elif "attempt" in data:
+                    stats.ack_latencies.append(time.perf_counter() - sent_at)
+                    stats.answers += 1
+                elif "help" in data:
+                    pending = asyncio.create_task(answer_later())
+                elif "leaderboard" in data:
+                    # Any message moves on to the next question
+                    stats.messages += 1
+                    await websocket.send("next")
+        finally:
+            if pending:
+                pending.cancel()
+            stats.players_done += 1
+
+
+async def host(args, ws_url: str, game_code: str, stats: Stats, players_ready: asyncio.Event, redis_client):
+    async with websockets.connect(f"{ws_url}/ws/host/{game_code}", max_size=None) as websocket:
+        async def receive():
+            async for _ in websocket:
+                stats.messages += 1
+        receiver = asyncio.create_task(receive())
+
+        await players_ready.wait()
+        commandstats = await redis_client.info("commandstats") if redis_client else None
+        start_time = time.perf_counter()
+        await websocket.send("start")
+
+        if args.pause_after:
+            await asyncio.sleep(args.pause_after)
+            await websocket.send("pause")
+            await asyncio.sleep(args.pause_for)
+            await websocket.send("resume")
+
+        while stats.players_done < args.players and time.perf_counter() - start_time < args.duration:
+            await asyncio.sleep(0.1)
+        duration = time.perf_counter() - start_time
+        await websocket.send("end")
+        await asyncio.sleep(0.5)
+        receiver.cancel()
+        return duration, commandstats
+
+
+def percentile(values: list, percent: float):
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+async def run_game(args):
+    ws_url = args.url.replace("http", "ws", 1)
+    stats = Stats()
+    redis_client = redis.from_url(args.redis_url, decode_responses=True) if args.redis_url else None
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as http:
+        response = await http.post("/api/creategame", params={"user_prompt": args.prompt})
+        response.raise_for_status()
+        game_code = response.json()["game_code"]
+        print(f"Game {game_code}")
+
+        player_names = [f"player{i}" for i in range(args.players)]
+        join_started = time.perf_counter()
+        semaphore = asyncio.Semaphore(args.connect_concurrency)
+
+        async def join(player_name: str):
+            async with semaphore:
+                (await http.post(f"/api/joingame/{game_code}", params={"player_name": player_name})).raise_for_status()
+        await asyncio.gather(*(join(player_name) for player_name in player_names))
+        print(f"Joined {args.players} players in {time.perf_counter() - join_started:.2f}s")
+
+    players_ready = asyncio.Event()
+    player_events = [asyncio.Event() for _ in player_names]
+    host_task = asyncio.create_task(host(args, ws_url, game_code, stats, players_ready, redis_client))
+    player_tasks = [
+        asyncio.create_task(play(args, ws_url, game_code, player_name, stats, event))
+        for player_name, event in zip(player_names, player_events)
+    ]
+    await asyncio.gather(*(event.wait() for event in player_events))
+    players_ready.set()
+
+    duration, commandstats = await host_task
+    results = await asyncio.gather(*player_tasks, return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+
+    print(f"Played for {duration:.2f}s, {stats.answers} answers, {len(errors)} player errors")
+    if stats.ack_latencies:
+        latencies = [latency * 1000 for latency in stats.ack_latencies]
+        print("Answer ack latency (ms): " + ", ".join(
+            f"p{p} {percentile(latencies, p):.1f}" for p in (50, 90, 99)
+        ) + f", max {max(latencies):.1f}")
+    print(f"Messages/sec: {stats.messages / duration:.0f}")
+
+    if redis_client:
+        after = await redis_client.info("commandstats")
+        calls = {
+            command.removeprefix("cmdstat_"): stat["calls"] - commandstats.get(command, {}).get("calls", 0)
+            for command, stat in after.items()
+        }
+        total_calls = sum(calls.values())
+        print(f"Redis commands/answer: {total_calls / max(stats.answers, 1):.1f}")
+        top_calls = sorted(calls.items(), key=lambda item: item[1], reverse=True)[:8]
+        print("  " + ", ".join(f"{command} {count}" for command, count in top_calls if count))
+        await redis_client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quizly load test")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stubs_parser = subparsers.add_parser("stubs", help="serve stub LLM and GitHub APIs")
+    stubs_parser.add_argument("--host", default="127.0.0.1")
+    stubs_parser.add_argument("--port", type=int, default=9000)
+    stubs_parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds added to every LLM response")
+    stubs_parser.add_argument("--questions", type=int, default=10, help="questions in the generated quiz")
+
+    run_parser = subparsers.add_parser("run", help="play a game against a running backend")
+    run_parser.add_argument("--url", default="http://localhost:8000")
+    run_parser.add_argument("--redis-url", help="the backend's Redis, to count commands per answer")
+    run_parser.add_argument("--players", type=int, default=100)
+    run_parser.add_argument("--prompt", default="Load test quiz")
+    run_parser.add_argument("--think-time", type=float, default=0.5, help="average seconds before answering")
+    run_parser.add_argument("--accuracy", type=float, default=0.7, help="chance of picking the stub's right answer")
+    run_parser.add_argument("--pause-after", type=float, default=0, help="seconds after start to pause, 0 to never pause")
+    run_parser.add_argument("--pause-for", type=float, default=2)
+    run_parser.add_argument("--duration", type=float, default=300, help="end the game after this many seconds")
+    run_parser.add_argument("--connect-concurrency", type=int, default=50)
+
+    args = parser.parse_args()
+    if args.command == "stubs":
+        run_stubs(args)
+    else:
+        asyncio.run(run_game(args))
+
+
+if __name__ == "__main__":
+    main()
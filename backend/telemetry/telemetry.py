@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+import functools
+import logging
+import os
+import random
+import time
+
+
+# Prometheus metrics, served on /metrics. With several workers, set PROMETHEUS_MULTIPROC_DIR
+# so every worker's samples are collected into one response.
+REDIS_CALL_SECONDS = Histogram(
+    "quizly_redis_call_seconds", "Time spent in each Redis helper", ["helper"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "quizly_llm_request_seconds", "LLM request latency", ["operation"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+HINT_CACHE_REQUESTS = Counter("quizly_hint_cache_requests", "Hint lookups by whether they were already cached", ["result"])
+WEBSOCKET_SEND_SECONDS = Histogram(
+    "quizly_websocket_send_seconds", "Time to send one WebSocket message",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1),
+)
+ANSWER_BATCH_SIZE = Histogram(
+    "quizly_answer_batch_size", "Answers committed per write-behind flush",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500),
+)
+# Labelled by role only: multiprocess gauges can't drop label sets, so per-game series would
+# stay behind after every game
+ACTIVE_WEBSOCKETS = Gauge("quizly_active_websockets", "Connected sockets", ["role"], multiprocess_mode="livesum")
+
+# Payloads such as questions are only logged with debug logging on, or for this fraction of calls
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0"))
+
+
+def timed_redis(func):
+    """Records how long an async Redis helper takes, labelled with its name."""
+    histogram = REDIS_CALL_SECONDS.labels(func.__name__)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start_time)
+    return wrapper
+
+
+async def send_text(websocket, text: str):
+    with WEBSOCKET_SEND_SECONDS.time():
+        await websocket.send_text(text)
+
+
+@contextmanager
+def track_websocket(role: str):
+    gauge = ACTIVE_WEBSOCKETS.labels(role)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def log_payload(message: str, payload):
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"{message}: {payload}")
+    elif LOG_PAYLOAD_SAMPLE_RATE and random.random() < LOG_PAYLOAD_SAMPLE_RATE:
+        logging.info(f"{message}: {payload}")
+
+
+def get_metrics():
+    """The exposition body and content type for /metrics."""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The backend modules import each other as top-level packages, as they do when run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importing helper builds the LLM provider, which must not need credentials or network
+os.environ.setdefault("LLM_PROVIDER", "fake")
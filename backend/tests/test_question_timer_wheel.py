@@ -0,0 +1,94 @@
+import asyncio
+
+from helper.helper import QuestionTimerWheel, TIMER_WHEEL_SLOTS
+
+
+def advance(wheel: QuestionTimerWheel, ticks: int):
+    """Moves the wheel on like its ticker does and resolves the due timers."""
+    for _ in range(ticks):
+        for timer in wheel._advance():
+            wheel.games.get(timer.game_code, set()).discard(timer)
+            timer.future.set_result(None)
+
+
+def test_timer_fires_on_its_tick():
+    async def run():
+        wheel = QuestionTimerWheel(0.1)
+        timer = wheel.schedule("GAME", 0.5)
+        advance(wheel, 4)
+        assert not timer.future.done()
+        assert abs(wheel.remaining(timer) - 0.1) < 1e-9
+        advance(wheel, 1)
+        assert timer.future.done()
+        assert wheel.remaining(timer) == 0
+        assert timer.remaining == 0
+    asyncio.run(run())
+
+
+def test_timer_cascades_from_higher_levels():
+    async def run():
+        wheel = QuestionTimerWheel(0.1)
+        ticks = TIMER_WHEEL_SLOTS * TIMER_WHEEL_SLOTS + 3
+        timer = wheel.schedule("GAME", ticks * 0.1)
+        advance(wheel, ticks - 1)
+        assert not timer.future.done()
+        advance(wheel, 1)
+        assert timer.future.done()
+    asyncio.run(run())
+
+
+def test_pause_freezes_and_resume_restores_remaining_time():
+    async def run():
+        wheel = QuestionTimerWheel(0.1)
+        timer = wheel.schedule("GAME", 1)
+        other = wheel.schedule("OTHER", 1)
+        advance(wheel, 3)
+        wheel.pause_game("GAME")
+        advance(wheel, 20)
+        assert not timer.future.done()
+        assert other.future.done()
+        assert abs(wheel.remaining(timer) - 0.7) < 1e-9
+
+        wheel.resume_game("GAME")
+        advance(wheel, 6)
+        assert not timer.future.done()
+        advance(wheel, 1)
+        assert timer.future.done()
+    asyncio.run(run())
+
+
+def test_timer_scheduled_while_paused_waits_for_resume():
+    async def run():
+        wheel = QuestionTimerWheel(0.1)
+        timer = wheel.schedule("GAME", 0.2, paused=True)
+        advance(wheel, 10)
+        assert not timer.future.done()
+        wheel.resume_game("GAME")
+        advance(wheel, 2)
+        assert timer.future.done()
+    asyncio.run(run())
+
+
+def test_cancelled_timer_never_fires():
+    async def run():
+        wheel = QuestionTimerWheel(0.1)
+        timer = wheel.schedule("GAME", 0.2)
+        wheel.cancel(timer)
+        advance(wheel, 5)
+        assert timer.future.cancelled()
+        assert "GAME" not in wheel.games
+    asyncio.run(run())
+
+
+def test_ticker_resolves_due_timers():
+    async def run():
+        wheel = QuestionTimerWheel(0.01)
+        await wheel.start()
+        try:
+            timers = [wheel.schedule("GAME", 0.03) for _ in range(100)]
+            await asyncio.wait_for(asyncio.gather(*(timer.future for timer in timers)), 1)
+            assert all(wheel.remaining(timer) == 0 for timer in timers)
+            assert "GAME" not in wheel.games
+        finally:
+            await wheel.stop()
+    asyncio.run(run())
@@ -13,6 +13,7 @@ interface PlayerMetric {
 }
 
 interface GameMetrics {
+  version: number;
   game_data: {
     code: string;
     start_time: number | null;
@@ -20,6 +21,9 @@ interface GameMetrics {
   player_metrics: Record<string, PlayerMetric>;
 }
 
+// Sent after the initial snapshot with only the players (and game data) that changed
+type GameMetricsDelta = Partial<GameMetrics> & { version: number };
+
 const CreateGame = () => {
   const [gameCode, setGameCode] = useState<string | null>(null);
   const [error, setError] = useState<boolean>(false);
@@ -62,6 +66,21 @@ const CreateGame = () => {
             setMetrics(data.metrics);
             const playerNames = Object.keys(data.metrics.player_metrics);
             setPlayers(playerNames);
+          } else if (data.metrics_delta) {
+            const delta: GameMetricsDelta = data.metrics_delta;
+            setMetrics((prev) => {
+              if (!prev) return prev;
+              const playerMetrics = {
+                ...prev.player_metrics,
+                ...delta.player_metrics,
+              };
+              setPlayers(Object.keys(playerMetrics));
+              return {
+                version: delta.version,
+                game_data: delta.game_data ?? prev.game_data,
+                player_metrics: playerMetrics,
+              };
+            });
           } else if (data.type === "info" && data.message === "[START]") {
             setGameStarted(true);
           } else {
@@ -98,6 +98,12 @@ const GamePlay = () => {
           if (data.attempt.final && !data.attempt.correct) {
             setExplanation("Incorrect again.");
           }
+        } else if (data.timer) {
+          // The server moved the deadline, e.g. by the length of a pause
+          const time = data.timer.start_time;
+          setStartTime(time);
+          const calculatedTimeLeft = time + 30 - Date.now() / 1000;
+          setTimeLeft(calculatedTimeLeft > 0 ? calculatedTimeLeft : 0);
         } else {
           console.warn("Unhandled WebSocket message format:", data);
         }